@@ -0,0 +1,84 @@
+#!/usr/bin/env python
+"""
+Bot inbound frame rate benchmark.
+
+Feeds a client a burst of channel messages from a stub server and
+reports how many inbound frames per second it handles, which bounds
+the message rate a bot can keep up with. Compare the full client
+against --headless.
+"""
+from __future__ import print_function
+import argparse
+import json
+import os
+import socket
+import sys
+import threading
+import time
+
+from IRC.Client import IRCClient, HeadlessClient
+
+
+def frames(count):
+    """ The stream a stub server sends: a nick and count messages"""
+    out = [json.dumps({'cmd': 'nick', 'src': 'NEWUSER', 'update': 'bot'})]
+    for i in xrange(count):
+        out.append(json.dumps({
+            'cmd': 'msg',
+            'src': 'user%d' % (i % 50),
+            'targets': ['#bots'],
+            'msg': 'message number %d for the bots' % i
+        }, separators=(',', ':')))
+    return "".join(f + "\r\n" for f in out)
+
+
+def serve(listener, data):
+    """ Send data to the first connection, then hang up"""
+    (conn, address) = listener.accept()
+    conn.sendall(data)
+    conn.shutdown(socket.SHUT_WR)
+    while conn.recv(4096) != "":
+        pass
+    conn.close()
+
+
+def main():
+    """ Run the bot inbound benchmark"""
+    parser = argparse.ArgumentParser(description="Bot Inbound Benchmark")
+    parser.add_argument('--frames', type=int, default=100000)
+    parser.add_argument('--headless', action='store_true')
+    args = parser.parse_args()
+
+    listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    listener.bind(('localhost', 0))
+    listener.listen(1)
+    port = listener.getsockname()[1]
+    server = threading.Thread(target=serve, args=(listener, frames(args.frames)))
+    server.daemon = True
+    server.start()
+
+    if args.headless:
+        client = HeadlessClient('localhost', port)
+        #A bot with nothing to do for the messages
+        client.on('msg', lambda src, targets, msg: None)
+    else:
+        client = IRCClient('localhost', port, None, autoQuit=True)
+
+    stdout = sys.stdout
+    sys.stdout = open(os.devnull, 'w')
+    try:
+        client.connect()
+        start = time.time()
+        client.run()
+        elapsed = time.time() - start
+    finally:
+        sys.stdout = stdout
+
+    print("client:          %s" % ("headless" if args.headless else "full"))
+    print("frames:          %d" % args.frames)
+    print("elapsed:         %.3fs" % elapsed)
+    print("frames/s:        %d" % (args.frames / elapsed))
+
+
+if __name__ == "__main__":
+    main()
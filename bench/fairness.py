@@ -0,0 +1,163 @@
+#!/usr/bin/env python
+"""
+Fair scheduling benchmark.
+
+Starts an irc_server, then one heavy client floods its own channel
+with pipelined messages while several light clients each send one
+message at a time to their own channel. Reports the latency the
+light clients see for their message to be echoed back.
+
+Run with --budget 0 to compare against unbudgeted scheduling.
+"""
+from __future__ import print_function
+import argparse
+import errno
+import json
+import os
+import select
+import socket
+import subprocess
+import sys
+import time
+
+SERVER = os.path.join(os.path.dirname(__file__), '..', 'src', 'irc_server')
+
+
+def percentile(values, p):
+    """ Return the p-th percentile of a sorted list"""
+    return values[min(len(values) - 1, int(len(values) * p / 100.0))]
+
+
+def frame(msg):
+    """ Encode a message as a frame"""
+    return json.dumps(msg, separators=(',', ':')) + "\r\n"
+
+
+class BenchConn(object):
+    """ A raw connection that joins a channel"""
+
+    def __init__(self, host, port, channel):
+        """ Connect and join the channel"""
+        self.sock = socket.create_connection((host, port))
+        self.buf = ""
+        self.channel = channel
+        self.sock.sendall(
+            frame({'cmd': 'join', 'src': 'bench', 'channels': [channel]})
+        )
+
+    def frames(self):
+        """ Read the available data and return the complete frames"""
+        data = self.sock.recv(65536)
+        if data == '':
+            raise socket.error("Server closed connection")
+        self.buf += data
+        lines = self.buf.split("\r\n")
+        self.buf = lines.pop()
+        return [json.loads(l) for l in lines if len(l)]
+
+    def answer(self, msgs):
+        """ Reply to any pings among the messages"""
+        for m in msgs:
+            if m.get('cmd') == 'ping':
+                self.sock.sendall(
+                    frame({'cmd': 'pong', 'src': 'bench', 'msg': m['msg']})
+                )
+
+
+def run(host, port, lights, duration):
+    """ Measure light client latency while a heavy client floods
+
+    The heavy client can fall far enough behind to miss a ping, in
+    which case it is reconnected and keeps flooding.
+    """
+    flood = frame(
+        {'cmd': 'msg', 'src': 'bench', 'targets': ['#heavy'], 'msg': 'x' * 16}
+    ) * 256
+    heavy = BenchConn(host, port, "#heavy")
+    heavy.sock.setblocking(0)
+    pending = ""
+    reconnects = 0
+
+    light = [BenchConn(host, port, "#light%d" % i) for i in xrange(lights)]
+    sent = {}
+    latencies = []
+    time.sleep(0.5)
+
+    end = time.time() + duration
+    while time.time() < end:
+        for c in light:
+            if c not in sent:
+                sent[c] = time.time()
+                c.sock.sendall(frame({'cmd': 'msg', 'src': 'bench',
+                                      'targets': [c.channel],
+                                      'msg': 'light'}))
+        outputs = [heavy.sock]
+        inputs = [c.sock for c in light] + [heavy.sock]
+        r, w, x = select.select(inputs, outputs, [], 0.1)
+        for c in light:
+            if c.sock in r:
+                msgs = c.frames()
+                c.answer(msgs)
+                for m in msgs:
+                    if m.get('cmd') == 'msg' and c in sent:
+                        latencies.append(time.time() - sent.pop(c))
+        try:
+            if heavy.sock in r:
+                #Pongs go between flood frames, never inside one
+                for m in heavy.frames():
+                    if m.get('cmd') == 'ping':
+                        pending += frame({'cmd': 'pong', 'src': 'bench',
+                                          'msg': m['msg']})
+            if heavy.sock in w:
+                if pending == "":
+                    pending = flood
+                pending = pending[heavy.sock.send(pending):]
+        except socket.error as e:
+            if e.errno in (errno.EAGAIN, errno.EWOULDBLOCK):
+                continue
+            heavy.sock.close()
+            heavy = BenchConn(host, port, "#heavy")
+            heavy.sock.setblocking(0)
+            pending = ""
+            reconnects += 1
+
+    return (latencies, reconnects)
+
+
+def main():
+    """ Run the fairness benchmark"""
+    parser = argparse.ArgumentParser(description="Fair Scheduling Benchmark")
+    parser.add_argument('--hostname', default="localhost")
+    parser.add_argument('--port', type=int, default=50051)
+    parser.add_argument('--lights', type=int, default=10)
+    parser.add_argument('--duration', type=float, default=10)
+    parser.add_argument('--budget', type=int, default=None)
+    args = parser.parse_args()
+
+    cmd = [sys.executable, SERVER, '--hostname', args.hostname, '--port',
+           str(args.port), '--log', os.devnull, '--user-rate', '0',
+           '--channel-rate', '0']
+    if args.budget != None:
+        cmd += ['--budget', str(args.budget)]
+    server = subprocess.Popen(cmd)
+    try:
+        time.sleep(1)
+        (latencies, reconnects) = run(
+            args.hostname, args.port, args.lights, args.duration
+        )
+        latencies.sort()
+    finally:
+        server.send_signal(2)
+        server.wait()
+
+    print("heavy reconnects: %d" % reconnects)
+    print("light messages:  %d" % len(latencies))
+    if len(latencies) == 0:
+        return
+    for p in (50, 90, 99):
+        print("p%d latency:    %.1fms" % (p, percentile(latencies, p) * 1000))
+    print("max latency:     %.1fms" % (latencies[-1] * 1000))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,120 @@
+#!/usr/bin/env python
+"""
+Large channel fan-out benchmark.
+
+Builds a server in process with a channel of many idle members, then
+has a client send a burst of messages to the channel while a probe
+client outside it keeps asking for the channel list. Reports the time
+until the burst is delivered to every member and the latency the probe
+sees meanwhile, which is how long the loop stalls for everyone else.
+Compare the default fan-out slice against --slice 0, which delivers
+each message to every member at once.
+"""
+from __future__ import print_function
+import argparse
+import imp
+import logging
+import os
+import socket
+import time
+
+from IRC.Client import HeadlessClient
+from IRC.Host import SessionHost
+
+SERVER = os.path.join(os.path.dirname(__file__), '..', 'src', 'irc_server')
+
+
+def main():
+    """ Run the fan-out benchmark"""
+    parser = argparse.ArgumentParser(description="Fan-out Benchmark")
+    parser.add_argument('--members', type=int, default=20000)
+    parser.add_argument('--messages', type=int, default=20)
+    parser.add_argument(
+        '--slice',
+        type=int,
+        default=None,
+        help="Deliveries per loop iteration (0 for all at once)"
+    )
+    parser.add_argument('--timeout', type=float, default=120)
+    args = parser.parse_args()
+
+    logging.disable(logging.CRITICAL)
+    irc_server = imp.load_source('irc_server', SERVER)
+    server = irc_server.IRCServer('localhost', 0)
+    server.setFloodControl((0, 0), (0, 0), (0, 0))
+    if args.slice != None:
+        server.setFanoutSlice(args.slice if args.slice > 0 else None)
+
+    #Idle members share a socket and are never flushed, only the work
+    #of queueing frames for them is measured
+    (sock, peer) = socket.socketpair()
+    channel = server.findCreateChannel(u"#big")
+    for i in xrange(args.members):
+        channel.addUser(irc_server.IRCUser(
+            sock, ('127.0.0.1', i), u"m{i}".format(i=i)
+        ))
+
+    host = SessionHost()
+    host.addSession(server)
+    (sender, probe) = (HeadlessClient('', 0), HeadlessClient('', 0))
+    for client in (sender, probe):
+        client.setLoopback(server)
+        client.connect()
+        host.addSession(client)
+    state = {'start': None, 'elapsed': None, 'asked': None}
+    latencies = []
+
+    def named(src, newnick):
+        if src == "NEWUSER":
+            sender.inputCmd("/join #big")
+
+    def joined(channel, names):
+        state['start'] = time.time()
+        #Sent to the sender itself after the burst, so it arrives last
+        sender.inputScript(
+            ["/msg #big message number %d\n" % i
+             for i in xrange(args.messages)] +
+            ["/msg %s done\n" % sender.getNick()]
+        )
+        ask()
+
+    def ask():
+        if state['elapsed'] == None:
+            state['asked'] = time.time()
+            probe.inputCmd("/channels")
+
+    def answered(channels):
+        latencies.append(time.time() - state['asked'])
+        ask()
+
+    def received(src, targets, msg):
+        if targets == [sender.getNick()]:
+            state['elapsed'] = time.time() - state['start']
+            host.stop()
+
+    sender.on('nick', named)
+    sender.on('names', joined)
+    sender.on('msg', received)
+    probe.on('channels', answered)
+    host.callLater(args.timeout, host.stop)
+    host.run()
+
+    print("members:         %d" % args.members)
+    print("messages:        %d" % args.messages)
+    if state['elapsed'] == None:
+        print("burst not delivered")
+        return
+    print("elapsed:         %.3fs" % state['elapsed'])
+    print("deliveries/s:    %d" % (
+        args.members * args.messages / state['elapsed']
+    ))
+    print("probe replies:   %d" % len(latencies))
+    if len(latencies):
+        print("probe mean:      %.3fms" % (
+            sum(latencies) / len(latencies) * 1000
+        ))
+        print("probe max:       %.3fms" % (max(latencies) * 1000))
+
+
+if __name__ == "__main__":
+    main()
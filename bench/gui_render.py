@@ -0,0 +1,122 @@
+#!/usr/bin/env python
+"""
+Headless benchmark of the ncurses ClientGUI.
+
+Curses is replaced with stub windows that only count the work
+requested of them, then a stream of chat, join and nick events is
+pushed through the client to measure the render cost per message.
+"""
+from __future__ import print_function
+import argparse
+import time
+import curses
+import IRC.GUI
+from IRC.Client import IRCClient
+
+
+class StubWindow(object):
+    """ A curses window that records the calls made to it"""
+    stats = {'addstr': 0, 'erase': 0, 'noutrefresh': 0, 'doupdate': 0}
+
+    def __init__(self, height, width, y=0, x=0):
+        """ Initialize window geometry"""
+        self.__size = (height, width)
+        self.__pos = (y, x)
+
+    def getmaxyx(self):
+        return self.__size
+
+    def getbegyx(self):
+        return self.__pos
+
+    def subwin(self, height, width, y, x):
+        return StubWindow(height, width, y, x)
+
+    def addstr(self, *args):
+        StubWindow.stats['addstr'] += 1
+
+    def erase(self):
+        StubWindow.stats['erase'] += 1
+
+    def noutrefresh(self):
+        StubWindow.stats['noutrefresh'] += 1
+
+    def scrollok(self, flag):
+        pass
+
+    def border(self):
+        pass
+
+    def getch(self):
+        return ord('a')
+
+
+class StubTextbox(object):
+    """ A textpad that ignores all input"""
+
+    def __init__(self, win):
+        self.win = win
+
+    def do_command(self, k):
+        pass
+
+    def gather(self):
+        return ""
+
+
+def doupdate():
+    StubWindow.stats['doupdate'] += 1
+
+
+class BenchClient(IRCClient):
+    """ A client that replays events into the GUI instead of a socket"""
+
+    def __init__(self, messages):
+        """ Initialize the client without a server"""
+        super(BenchClient, self).__init__("localhost", 0)
+        self.__messages = messages
+        self.elapsed = 0
+
+    def run(self, shutdown=True):
+        """ Feed the event stream through the client"""
+        self.receivedJoin(None, self.getNick(), ["#bench"], {})
+        self.inputCmd("/migrate #bench\n")
+        start = time.time()
+        for i in xrange(self.__messages):
+            nick = "user%d" % (i % 50)
+            if i % 100 == 0:
+                self.receivedJoin(None, nick, ["#bench"], {})
+            elif i % 250 == 1:
+                self.receivedNick(None, nick, nick + "x")
+                self.receivedNick(None, nick + "x", nick)
+            else:
+                self.receivedMsg(None, nick, ["#bench"], "message %d" % i)
+            self.timeStep()
+        self.elapsed = time.time() - start
+
+
+def main():
+    """ Run the render benchmark"""
+    parser = argparse.ArgumentParser(description="GUI Render Benchmark")
+    parser.add_argument('--messages', type=int, default=20000)
+    parser.add_argument('--height', type=int, default=50)
+    parser.add_argument('--width', type=int, default=160)
+    args = parser.parse_args()
+
+    curses.newwin = StubWindow
+    curses.doupdate = doupdate
+    IRC.GUI.textpad.Textbox = StubTextbox
+
+    client = BenchClient(args.messages)
+    client.guirun(StubWindow(args.height, args.width))
+
+    per_msg = client.elapsed / args.messages
+    print("messages:        %d" % args.messages)
+    print("total time:      %.3fs" % client.elapsed)
+    print("per message:     %.1fus" % (per_msg * 1e6))
+    for (k, v) in sorted(StubWindow.stats.items()):
+        print("%-16s %d" % (k + ":", v))
+
+
+if __name__ == "__main__":
+    main()
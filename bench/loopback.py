@@ -0,0 +1,107 @@
+#!/usr/bin/env python
+"""
+Loopback transport benchmark.
+
+Runs a server and headless clients on one SessionHost in this process.
+The clients join a channel and one of them sends a burst of messages
+to it. Reports how long it takes until every other client has received
+every message, and the CPU time spent in the kernel meanwhile. The
+clients are linked to the server by loopback sockets, or with --tcp by
+real connections over the TCP stack.
+"""
+from __future__ import print_function
+import argparse
+import imp
+import logging
+import os
+import resource
+import time
+
+from IRC.Client import HeadlessClient
+from IRC.Host import SessionHost
+
+SERVER = os.path.join(os.path.dirname(__file__), '..', 'src', 'irc_server')
+
+
+def systemTime():
+    """ CPU seconds this process has spent in the kernel"""
+    return resource.getrusage(resource.RUSAGE_SELF).ru_stime
+
+
+def main():
+    """ Run the loopback transport benchmark"""
+    parser = argparse.ArgumentParser(description="Loopback Benchmark")
+    parser.add_argument('--port', type=int, default=50060)
+    parser.add_argument('--clients', type=int, default=50)
+    parser.add_argument('--messages', type=int, default=1000)
+    parser.add_argument('--tcp', action='store_true',
+                        help="Connect over TCP instead of loopback sockets")
+    parser.add_argument('--timeout', type=float, default=120)
+    args = parser.parse_args()
+
+    logging.disable(logging.CRITICAL)
+    irc_server = imp.load_source('irc_server', SERVER)
+    server = irc_server.IRCServer('localhost', args.port)
+    server.setFloodControl((0, 0), (0, 0), (0, 0))
+    if args.tcp and not server.connect():
+        return
+
+    host = SessionHost()
+    host.addSession(server)
+    clients = []
+    for i in xrange(args.clients + 1):
+        client = HeadlessClient('localhost', args.port)
+        if not args.tcp:
+            client.setLoopback(server)
+        client.connect()
+        host.addSession(client)
+        clients.append(client)
+    (sender, receivers) = (clients[0], clients[1:])
+    state = {
+        'joined': 0, 'delivered': 0, 'start': None, 'elapsed': None,
+        'system': None
+    }
+    total = args.messages * len(receivers)
+
+    def named(client, src, newnick):
+        if src == "NEWUSER":
+            client.inputCmd("/join #bench")
+
+    def joined(channel, names):
+        state['joined'] += 1
+        if state['joined'] == len(clients):
+            state['start'] = time.time()
+            state['system'] = systemTime()
+            sender.inputScript(
+                "/msg #bench message number %d\n" % i
+                for i in xrange(args.messages)
+            )
+
+    def received(src, targets, msg):
+        state['delivered'] += 1
+        if state['delivered'] == total:
+            state['elapsed'] = time.time() - state['start']
+            state['system'] = systemTime() - state['system']
+            host.stop()
+
+    for client in clients:
+        client.on('nick', lambda s, n, client=client: named(client, s, n))
+        client.on('names', joined)
+    for client in receivers:
+        client.on('msg', received)
+    host.callLater(args.timeout, host.stop)
+    host.run()
+
+    print("transport:       %s" % ("tcp" if args.tcp else "loopback"))
+    print("receivers:       %d" % len(receivers))
+    print("messages:        %d" % args.messages)
+    print("delivered:       %d" % state['delivered'])
+    if state['elapsed'] == None:
+        return
+    print("elapsed:         %.3fs" % state['elapsed'])
+    print("deliveries/s:    %d" % (total / state['elapsed']))
+    print("system cpu:      %.3fs" % state['system'])
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,92 @@
+#!/usr/bin/env python
+"""
+Server memory benchmark.
+
+Builds the server side state of many idle connections and channel
+memberships in process, without any traffic, and reports the memory
+used per connection and per membership. The connections all share one
+socket, so only the server's own objects are measured, not the kernel
+socket buffers.
+"""
+from __future__ import print_function
+import argparse
+import gc
+import imp
+import logging
+import os
+import socket
+
+SERVER = os.path.join(os.path.dirname(__file__), '..', 'src', 'irc_server')
+
+
+def rss():
+    """ Resident memory of this process in bytes"""
+    with open('/proc/self/statm') as statm:
+        pages = int(statm.read().split()[1])
+    return pages * os.sysconf('SC_PAGE_SIZE')
+
+
+def measure(fn):
+    """ Run fn and return its result and the memory it kept"""
+    gc.collect()
+    before = rss()
+    result = fn()
+    gc.collect()
+    return (result, rss() - before)
+
+
+def main():
+    """ Run the memory benchmark"""
+    parser = argparse.ArgumentParser(description="Server Memory Benchmark")
+    parser.add_argument('--connections', type=int, default=100000)
+    parser.add_argument('--channels', type=int, default=1000)
+    parser.add_argument(
+        '--joins',
+        type=int,
+        default=10,
+        help="Channels joined by each connection"
+    )
+    args = parser.parse_args()
+
+    logging.disable(logging.CRITICAL)
+    irc_server = imp.load_source('irc_server', SERVER)
+    server = irc_server.IRCServer('localhost', 0)
+    (sock, peer) = socket.socketpair()
+
+    def connect():
+        users = []
+        for i in xrange(args.connections):
+            #Names arrive as unicode from decoded JSON messages
+            user = irc_server.IRCUser(
+                sock, ('127.0.0.1', i), u"user{i}".format(i=i)
+            )
+            user.getSocketBuffer().setBucket(irc_server.TokenBucket(
+                irc_server.USER_RATE, irc_server.USER_BURST
+            ))
+            users.append(user)
+        return users
+
+    def join(users):
+        channels = [
+            server.findCreateChannel(u"#chan{i}".format(i=i))
+            for i in xrange(args.channels)
+        ]
+        for (i, user) in enumerate(users):
+            for j in xrange(args.joins):
+                channels[(i + j) % len(channels)].addUser(user)
+        for c in channels:
+            c.getRecipients()
+        return channels
+
+    (users, connMem) = measure(connect)
+    (channels, joinMem) = measure(lambda: join(users))
+    memberships = args.connections * args.joins
+
+    print("connections:          %d" % args.connections)
+    print("bytes per connection: %d" % (connMem / args.connections))
+    print("memberships:          %d" % memberships)
+    print("bytes per membership: %d" % (joinMem / memberships))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,196 @@
+#!/usr/bin/env python
+"""
+Network flap benchmark.
+
+Starts an irc_server, connects many clients spread over a few channels
+and then drops every connection at once, as a network blip would.
+The clients reconnect and either resume their sessions with their
+session tokens or, with --resync, start over by asking for their
+nicknames and rejoining their channels. Reports how long it takes until
+every client is back and how much the server sent meanwhile.
+"""
+from __future__ import print_function
+import argparse
+import json
+import os
+import resource
+import select
+import socket
+import struct
+import subprocess
+import sys
+import time
+
+SERVER = os.path.join(os.path.dirname(__file__), '..', 'src', 'irc_server')
+
+
+class Conn(object):
+    """ A raw client connection that counts what it receives"""
+    def __init__(self, host, port):
+        self.sock = socket.create_connection((host, port))
+        self.data = ''
+        self.received = 0
+        self.frames = 0
+
+    def fileno(self):
+        return self.sock.fileno()
+
+    def send(self, **msg):
+        self.sock.sendall(json.dumps(msg) + "\r\n")
+
+    def read(self):
+        """ Read what is available and return the complete messages"""
+        recvd = self.sock.recv(65536)
+        if recvd == '':
+            raise socket.error("server closed connection")
+        self.received += len(recvd)
+        self.data += recvd
+        lines = self.data.split("\r\n")
+        self.data = lines.pop()
+        self.frames += len(lines)
+        msgs = []
+        for line in lines:
+            msg = json.loads(line)
+            if msg.get('cmd') == 'ping':
+                self.send(cmd='pong', src='NEWUSER', msg=msg['msg'])
+            msgs.append(msg)
+        return msgs
+
+    def drop(self):
+        """ Reset the connection without a goodbye"""
+        self.sock.setsockopt(
+            socket.SOL_SOCKET, socket.SO_LINGER, struct.pack('ii', 1, 0)
+        )
+        self.sock.close()
+
+
+def pump(conns, done, timeout):
+    """ Read from conns until done(conn, msg) is true for each of them"""
+    pending = set(conns)
+    start = time.time()
+    while len(pending) and time.time() - start < timeout:
+        (ready, _, _) = select.select(list(pending), [], [], 1.0)
+        for c in ready:
+            for msg in c.read():
+                if done(c, msg):
+                    pending.discard(c)
+    return len(pending)
+
+
+def settle(conns, quiet):
+    """ Read from conns until none of them has received for quiet seconds"""
+    while True:
+        (ready, _, _) = select.select(conns, [], [], quiet)
+        if len(ready) == 0:
+            return
+        for c in ready:
+            c.read()
+
+
+def namesEnd(c, msg):
+    """ The reply ending the member list of the channel joined"""
+    return (msg.get('reply') in ('names', 'delta') and
+            len(msg.get('names', msg.get('added', []))) == 0 and
+            len(msg.get('removed', [])) == 0)
+
+
+def online(host, port, clients, channels, timeout):
+    """ Connect, name and join every client, returning nicks and tokens"""
+    conns = [Conn(host, port) for i in xrange(clients)]
+    tokens = {}
+
+    def isNamed(c, msg):
+        if msg.get('cmd') == 'session':
+            tokens[c] = msg['token']
+        return msg.get('cmd') == 'nick' and msg['src'] == 'NEWUSER'
+
+    pump(conns, isNamed, timeout)
+    settle(conns, 0.5)
+    for (i, c) in enumerate(conns):
+        c.nick = "c%d" % i
+        c.channel = "#ch%d" % (i % channels)
+        c.send(cmd='nick', src='NEWUSER', update=c.nick)
+        c.send(cmd='join', src=c.nick, channels=[c.channel])
+    pump(conns, namesEnd, timeout)
+    settle(conns, 0.5)
+    return [(c.nick, c.channel, tokens.get(c)) for c in conns], conns
+
+
+def flap(host, port, sessions, resync, timeout):
+    """ Reconnect every session and time until each is back"""
+    conns = []
+    start = time.time()
+    for (nick, channel, token) in sessions:
+        c = Conn(host, port)
+        (c.nick, c.channel, c.token) = (nick, channel, token)
+        if not resync:
+            c.send(cmd='resume', src='NEWUSER', token=token)
+        conns.append(c)
+
+    back = {}
+
+    def isBack(c, msg):
+        if resync and msg.get('cmd') == 'nick' and msg['src'] == 'NEWUSER':
+            c.send(cmd='nick', src='NEWUSER', update=c.nick)
+            c.send(cmd='join', src=c.nick, channels=[c.channel])
+        elif c not in back and ((resync and namesEnd(c, msg)) or (
+                not resync and msg.get('cmd') == 'resume')):
+            back[c] = time.time() - start
+        return c in back
+
+    failed = pump(conns, isBack, timeout)
+    settle(conns, 0.5)
+    return (sorted(back.values()), failed, conns)
+
+
+def main():
+    """ Run the network flap benchmark"""
+    parser = argparse.ArgumentParser(description="Network Flap Benchmark")
+    parser.add_argument('--hostname', default="localhost")
+    parser.add_argument('--port', type=int, default=50050)
+    parser.add_argument('--clients', type=int, default=500)
+    parser.add_argument('--channels', type=int, default=10)
+    parser.add_argument('--resync', action='store_true',
+                        help="Rejoin from scratch instead of resuming")
+    parser.add_argument('--timeout', type=float, default=120)
+    args = parser.parse_args()
+
+    (soft, hard) = resource.getrlimit(resource.RLIMIT_NOFILE)
+    resource.setrlimit(
+        resource.RLIMIT_NOFILE, (min(hard, args.clients * 4 + 64), hard)
+    )
+
+    # A resync has to wait out held sessions, so hold none
+    grace = '0' if args.resync else '60'
+    cmd = [sys.executable, SERVER, '--hostname', args.hostname, '--port',
+           str(args.port), '--log', os.devnull, '--session-grace', grace,
+           '--user-burst', '1000', '--channel-burst', '100000']
+    server = subprocess.Popen(cmd)
+    try:
+        time.sleep(1)
+        (sessions, conns) = online(
+            args.hostname, args.port, args.clients, args.channels,
+            args.timeout
+        )
+        for c in conns:
+            c.drop()
+        time.sleep(0.5)
+        (back, failed, conns) = flap(
+            args.hostname, args.port, sessions, args.resync, args.timeout
+        )
+    finally:
+        server.send_signal(2)
+        server.wait()
+
+    print("mode:            %s" % ("resync" if args.resync else "resume"))
+    print("clients back:    %d" % len(back))
+    print("clients failed:  %d" % failed)
+    print("frames received: %d" % sum(c.frames for c in conns))
+    print("bytes received:  %d" % sum(c.received for c in conns))
+    if len(back) == 0:
+        return
+    print("all back:        %.3fs" % back[-1])
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,108 @@
+#!/usr/bin/env python
+"""
+Reconnect storm benchmark.
+
+Starts an irc_server and opens many client connections at once, as
+happens when every client reconnects after a restart. Reports how
+long it takes until every client has been assigned its nickname by
+the server and is therefore online.
+"""
+from __future__ import print_function
+import argparse
+import errno
+import os
+import resource
+import select
+import socket
+import subprocess
+import sys
+import time
+
+SERVER = os.path.join(os.path.dirname(__file__), '..', 'src', 'irc_server')
+
+
+def percentile(values, p):
+    """ Return the p-th percentile of a sorted list"""
+    return values[min(len(values) - 1, int(len(values) * p / 100.0))]
+
+
+def storm(host, port, clients, timeout):
+    """ Connect all clients at once and time until each is online"""
+    pending = {}
+    online = []
+    failed = 0
+    start = time.time()
+    for i in xrange(clients):
+        s = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        s.setblocking(0)
+        e = s.connect_ex((host, port))
+        if e not in (0, errno.EINPROGRESS):
+            raise socket.error(e, os.strerror(e))
+        pending[s.fileno()] = (s, "")
+
+    poll = select.poll()
+    for fd in pending:
+        poll.register(fd, select.POLLIN)
+
+    while len(pending) and time.time() - start < timeout:
+        for (fd, event) in poll.poll(1000):
+            (s, data) = pending[fd]
+            try:
+                recvd = s.recv(1024)
+            except socket.error:
+                recvd = ''
+            if recvd == '' or "\n" in data + recvd:
+                if recvd == '':
+                    failed += 1
+                else:
+                    online.append(time.time() - start)
+                poll.unregister(fd)
+                del pending[fd]
+                s.close()
+            else:
+                pending[fd] = (s, data + recvd)
+
+    return (online, failed + len(pending))
+
+
+def main():
+    """ Run the reconnect storm benchmark"""
+    parser = argparse.ArgumentParser(description="Reconnect Storm Benchmark")
+    parser.add_argument('--hostname', default="localhost")
+    parser.add_argument('--port', type=int, default=50050)
+    parser.add_argument('--clients', type=int, default=2000)
+    parser.add_argument('--backlog', type=int, default=None)
+    parser.add_argument('--timeout', type=float, default=120)
+    args = parser.parse_args()
+
+    (soft, hard) = resource.getrlimit(resource.RLIMIT_NOFILE)
+    resource.setrlimit(
+        resource.RLIMIT_NOFILE, (min(hard, args.clients * 2 + 64), hard)
+    )
+
+    cmd = [sys.executable, SERVER, '--hostname', args.hostname, '--port',
+           str(args.port), '--log', os.devnull]
+    if args.backlog != None:
+        cmd += ['--backlog', str(args.backlog)]
+    server = subprocess.Popen(cmd)
+    try:
+        time.sleep(1)
+        (online, failed) = storm(
+            args.hostname, args.port, args.clients, args.timeout
+        )
+        online.sort()
+    finally:
+        server.send_signal(2)
+        server.wait()
+
+    print("clients online:  %d" % len(online))
+    print("clients failed:  %d" % failed)
+    if len(online) == 0:
+        return
+    print("all online:      %.3fs" % online[-1])
+    for p in (50, 90, 99):
+        print("p%d online:     %.3fs" % (p, percentile(online, p)))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,88 @@
+#!/usr/bin/env python
+"""
+Startup time benchmark.
+
+Repeatedly starts a client process against a listening socket and
+reports the time from starting the process until its first frame
+arrives, which is what a fleet of short-lived bots pays per start.
+"""
+from __future__ import print_function
+import argparse
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+
+SRC = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src')
+PROGRAMS = {
+    'client': [os.path.join(SRC, 'IRC', 'Client.py'), '--script'],
+    'math_bot': [os.path.join(SRC, 'math_bot')],
+}
+
+
+def firstFrame(listener, cmd, timeout):
+    """ Start cmd and return the seconds until its first frame"""
+    start = time.time()
+    proc = subprocess.Popen(cmd)
+    try:
+        listener.settimeout(timeout)
+        (conn, address) = listener.accept()
+        conn.settimeout(timeout)
+        data = ""
+        while "\n" not in data:
+            chunk = conn.recv(4096)
+            if chunk == "":
+                raise socket.error("Connection closed before a frame")
+            data += chunk
+        elapsed = time.time() - start
+        conn.close()
+        return elapsed
+    finally:
+        deadline = time.time() + timeout
+        while proc.poll() == None and time.time() < deadline:
+            time.sleep(0.01)
+        if proc.poll() == None:
+            proc.kill()
+            proc.wait()
+
+
+def main():
+    """ Run the startup benchmark"""
+    parser = argparse.ArgumentParser(description="Startup Time Benchmark")
+    parser.add_argument('--program', choices=sorted(PROGRAMS), default='client')
+    parser.add_argument('--runs', type=int, default=20)
+    parser.add_argument('--timeout', type=float, default=30)
+    args = parser.parse_args()
+
+    listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    listener.bind(('localhost', 0))
+    listener.listen(1)
+    port = listener.getsockname()[1]
+
+    os.environ['PYTHONPATH'] = os.pathsep.join(
+        [SRC] + [p for p in [os.environ.get('PYTHONPATH')] if p]
+    )
+
+    with tempfile.NamedTemporaryFile(suffix='.irc') as script:
+        script.write("/join #bench\n")
+        script.flush()
+        cmd = [sys.executable] + PROGRAMS[args.program]
+        if args.program == 'client':
+            cmd.append(script.name)
+        cmd += ['--port', str(port)]
+
+        times = sorted(
+            firstFrame(listener, cmd, args.timeout) for i in xrange(args.runs)
+        )
+
+    print("program:          %s" % args.program)
+    print("runs:             %d" % args.runs)
+    print("min first frame:  %.1fms" % (times[0] * 1000))
+    print("p50 first frame:  %.1fms" % (times[len(times) // 2] * 1000))
+    print("max first frame:  %.1fms" % (times[-1] * 1000))
+
+
+if __name__ == "__main__":
+    main()
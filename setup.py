@@ -12,7 +12,7 @@ setup(
     author='Mitch Souders',
     author_email='msouders@pdx.edu',
     scripts=[
-        'src/irc_server', 'src/irc_bot', 'src/math_bot'
+        'src/irc_server', 'src/irc_bot', 'src/math_bot', 'src/irc_replay'
     ],
     package_dir={'': 'src'},
     py_modules=[
@@ -27,8 +27,11 @@ setup(
     #packages=['distutils', 'distutils.command'],
     install_requires=[
         'petname',
-        'jsonschema',
         'more_itertools',
         'mathjspy',
+    ],
+    test_suite='tests',
+    tests_require=[
+        'jsonschema',
     ]
 )
@@ -9,21 +9,27 @@ import socket as sockmod
 import sys
 import argparse
 import re
-from more_itertools import unique_everseen
+import errno
 import IRC
-import curses
+import IRC.Schema
 from collections import defaultdict
+import itertools
 import logging
-from IRC.Handler import SocketBuffer
+import time
+from IRC.Handler import SocketBuffer, TrustedSocketBuffer
+from IRC.Message import internName
 import signal
-from IRC.GUI import ClientGUI, ClientConsole
+from IRC.Console import ClientConsole
+
+#Seconds to keep trying to resume the session after a disconnect
+RECONNECT_TIMEOUT = 30
+#Seconds between attempts to reconnect
+RECONNECT_DELAY = 1
 
 
 def unique(items):
     """ Return list of unique items in list"""
-    u = list(unique_everseen(items))
-    u.sort()
-    return u
+    return sorted(set(items))
 
 
 class CommandParseError(Exception):
@@ -63,12 +69,17 @@ class CmdArg(object):
         """
         self.__title = title
         self.__regex = regex
+        self.__compiled = re.compile(regex)
         self.__error = error
 
     def pattern(self):
         """Get the pattern of the command"""
         return self.__regex
 
+    def match(self, s):
+        """Match a string against the compiled pattern"""
+        return self.__compiled.match(s)
+
     def error(self):
         """Get the error of the command"""
         return self.__error
@@ -108,6 +119,7 @@ class Command(object):
             self.__args = []
         self.__cmd = cmd
         self.__extra = extra
+        self.__regex = re.compile(self.__pattern())
 
     def name(self):
         """ Get Command Name"""
@@ -140,10 +152,10 @@ class Command(object):
 
         Possibly throws exception if no command matches.
         """
-        m = re.match(self.__pattern(), line)
+        m = self.__regex.match(line)
         if m:
             compare = map(
-                lambda (arg, s): (arg, re.match(arg.pattern(), s), s), zip(
+                lambda (arg, s): (arg, arg.match(s), s), zip(
                     self.__args, m.groups()
                 )
             )
@@ -170,6 +182,7 @@ class CommandProcessor(object):
         nick=IRC.Schema.NICK,
         channel=IRC.Schema.CHANNEL
     )
+    CMD_NAME = re.compile(r"^/(\w+)\b")
 
     def __init__(self):
         """ Initialize Set of Commands"""
@@ -203,6 +216,14 @@ class CommandProcessor(object):
                            "Invalid Channel List")
                 ]
             ),
+            Command(
+                'refresh',
+                self.__refreshCmd,
+                args=[
+                    CmdArg("ChannelList", self.CHANNEL_LIST,
+                           "Invalid Channel List")
+                ]
+            ),
             Command(
                 'nick',
                 self.__nickCmd,
@@ -246,6 +267,7 @@ class CommandProcessor(object):
                 'help', self.__helpCmd
             ),
         ]
+        self.__table = {c.name(): c for c in self.__cmds}
 
     def __helpCmd(self, client):
         """ Notify client of potential commands """
@@ -255,7 +277,10 @@ class CommandProcessor(object):
 
     def __joinCmd(self, client, channels):
         """ Notify server of request to join channels """
-        irc_msg = client.getIRCMsg().cmdJoin(unique(channels.split(',')))
+        channels = unique(channels.split(','))
+        irc_msg = client.getIRCMsg().cmdJoin(
+            channels, since=client.knownVersions(channels)
+        )
         client.sendMsg(client.serverSocket(), irc_msg)
 
     def __leaveCmd(self, client, channels, msg):
@@ -265,12 +290,35 @@ class CommandProcessor(object):
 
     def __channelsCmd(self, client):
         """ Notify server of request to get channels list"""
-        irc_msg = client.getIRCMsg().cmdChannels()
+        irc_msg = client.getIRCMsg().cmdChannels(client.newRequestId())
         client.sendMsg(client.serverSocket(), irc_msg)
 
     def __usersCmd(self, client, channels):
-        """ Notify server of request to get list of users in channels"""
-        irc_msg = client.getIRCMsg().cmdUsers(unique(channels.split(',')), True)
+        """ Show the list of users in channels
+
+        Channels whose members the client keeps current are shown
+        without asking the server, which is asked for the others.
+        """
+        channels = unique(channels.split(','))
+        ask = []
+        for c in channels:
+            members = client.knownMembers(c)
+            if members == None:
+                ask.append(c)
+            else:
+                client.showNames(c, [u.getName() for u in members], True)
+        if len(ask) == 0:
+            return
+        irc_msg = client.getIRCMsg().cmdUsers(
+            ask, True, client.newRequestId(), client.knownVersions(ask)
+        )
+        client.sendMsg(client.serverSocket(), irc_msg)
+
+    def __refreshCmd(self, client, channels):
+        """ Ask the server for the full list of users in channels"""
+        irc_msg = client.getIRCMsg().cmdUsers(
+            unique(channels.split(',')), True, client.newRequestId()
+        )
         client.sendMsg(client.serverSocket(), irc_msg)
 
     def __nickCmd(self, client, nick):
@@ -281,6 +329,7 @@ class CommandProcessor(object):
     def __quitCmd(self, client, msg):
         """ Notify server of request to quit"""
         irc_msg = client.getIRCMsg().cmdQuit(msg)
+        client.quitting()
         client.sendMsg(client.serverSocket(), irc_msg)
         if client.serverSocket().isDead():
             client.stop()
@@ -337,18 +386,16 @@ class CommandProcessor(object):
         if not self.isCmd(line):
             return CommandResult(self.__chanMsgCmd, 'chanmsg', [line.rstrip()])
 
-        matched_cmd = filter(lambda c: re.match(r'^/{name}\b'.format(name=c.name()), line), self.__cmds)
+        m = self.CMD_NAME.match(line)
+        cmd = self.__table.get(m.group(1)) if m else None
 
-        if len(matched_cmd) == 0:
+        if cmd == None:
             raise CommandParseError(
                 "Unknown command %s" % re.match(
-                    "^(/\S+)", line
+                    "^(/\S*)", line
                 ).group(1)
             )
-        elif len(matched_cmd) > 1:
-            raise CommandParseError("Multiple commands match.")
 
-        cmd = matched_cmd[0]
         return cmd.process(line)
 
 
@@ -364,14 +411,15 @@ def clientIgnore(some_func):
 
 class ClientUser(object):
     """ A simple Reference to a Name for storing in Channels """
+    __slots__ = ('__name', )
 
     def __init__(self, name):
         """ Initialize Name """
-        self.__name = name
+        self.__name = internName(name)
 
     def updateName(self, name):
         """ Update on nick change """
-        self.__name = name
+        self.__name = internName(name)
 
     def getName(self):
         """ Return the given name """
@@ -384,12 +432,21 @@ class ClientChannel(object):
     Allows for easy name switching and storage of history
     """
     MAX_HISTORY = 100  # Length of History Buffer
+    __slots__ = (
+        '__name', '__users', '__history', '__historyCount', '__version',
+        '__synced'
+    )
 
     def __init__(self, name):
         """ Initialize Channell """
-        self.__name = name
+        self.__name = internName(name)
         self.__users = []
         self.__history = []
+        self.__historyCount = 0
+        #Server membership version the user list was last synced to
+        self.__version = None
+        #The user list is complete and kept current by the server
+        self.__synced = False
 
     def addUser(self, user):
         """ Add a user to channel """
@@ -399,9 +456,35 @@ class ClientChannel(object):
         """ Remove the user from channel """
         self.__users.remove(user)
 
-    def receivedNames(self, users):
+    def receivedNames(self, users, version=None):
         """ Received a list of names to be used"""
         self.__users = users
+        self.__version = version
+
+    def receivedDelta(self, added, removed, version):
+        """ Apply the members added and removed since our version
+
+        Names may already be up to date from join, leave and nick
+        messages received meanwhile, so each change is only applied
+        if it isn't already.
+        """
+        removed = set(removed)
+        self.__users = [u for u in self.__users if u.getName() not in removed]
+        names = set([u.getName() for u in self.__users])
+        self.__users.extend([u for u in added if u.getName() not in names])
+        self.__version = version
+
+    def getVersion(self):
+        """ Get the membership version last synced to (or None)"""
+        return self.__version
+
+    def setSynced(self, synced):
+        """ Mark if the user list is complete and kept current"""
+        self.__synced = synced
+
+    def isSynced(self):
+        """ Is the user list complete and kept current?"""
+        return self.__synced
 
     def userList(self):
         """ Return full list of users """
@@ -411,10 +494,15 @@ class ClientChannel(object):
         """ Returns the chat history """
         return self.__history
 
+    def historyCount(self):
+        """ Returns the number of messages ever added to history """
+        return self.__historyCount
+
     def addHistory(self, msg):
         """ Append a message to history, limited length """
         self.__history.append(msg)
         self.__history = self.__history[-self.MAX_HISTORY:]
+        self.__historyCount += 1
 
     def userInChannel(self, user):
         """ Does the given user exist in channel """
@@ -432,18 +520,41 @@ class IRCClient(IRC.Handler.IRCHandler):
     a fully formed Client for the IRC protocol.
     """
 
-    def __init__(self, host, port, userinput=sys.stdin, autoQuit=False):
+    def __init__(
+        self, host, port, userinput=sys.stdin, autoQuit=False,
+        buffer=SocketBuffer
+    ):
         """ Initialize Client"""
         self.__nick = "NEWUSER"
         super(IRCClient, self).__init__(self.__nick, host, port)
         self.__cmdProc = CommandProcessor()
         self.__server = None
+        self.__buffer = buffer
+        self.__unixPath = None
+        #IRCServer in this process to connect to over a loopback socket
+        self.__loopback = None
         self.__noneChannel = self.__currentChannel = ClientChannel("None")
         self.__input = userinput
         self.__gui = ClientConsole(self)
-        self.__tempNames = []
-        self.__tempChannels = []
+        #Partial names/delta/channels replies by (request id, channel)
+        self.__tempNames = {}
+        self.__tempDeltas = {}
+        self.__tempChannels = {}
+        self.__requestIds = itertools.count(1)
         self.__autoQuit = autoQuit
+        #Token to resume the session with after a disconnect
+        self.__token = None
+        #The user asked to quit, the connection closing is expected
+        self.__quitting = False
+        self.__reconnectTimeout = RECONNECT_TIMEOUT
+        #Disconnected from the server, retrying until the deadline
+        self.__disconnected = False
+        self.__reconnectAt = None
+        self.__reconnectBy = None
+        #Waiting on the server to resume our session
+        self.__resuming = False
+        #Name given to the new connection, used if resuming fails
+        self.__tempNick = None
         self.__allUsers = {}
         self.__allChannels = {self.__noneChannel.getName(): self.__noneChannel}
 
@@ -452,21 +563,75 @@ class IRCClient(IRC.Handler.IRCHandler):
     def getNoneChannel(self):
         return self.__noneChannel
 
+    def newRequestId(self):
+        """ Get an id for a request whose replies should be told apart"""
+        return next(self.__requestIds)
+
+    def knownMembers(self, name):
+        """ The users of a channel, if our list of them is current
+
+        Once we have synced the list of a channel we are in, the server
+        sends us every change to it, so it stays current as long as we
+        stay in the channel and connected. Otherwise None.
+        """
+        c = self.findChannel(name)
+        if c == None or not c.isSynced() or self.__resuming or \
+                self.__server == None or self.__server.isDead():
+            return None
+        return c.userList()
+
+    def knownVersions(self, channels):
+        """ Map the channels to the membership versions we have synced"""
+        versions = {}
+        for name in channels:
+            c = self.findChannel(name)
+            if c != None and c.getVersion() != None:
+                versions[name] = c.getVersion()
+        return versions
+
+    def setUnixPath(self, path):
+        """ Connect to a local server's unix socket instead of TCP"""
+        self.__unixPath = path
+
+    def setLoopback(self, server):
+        """ Connect to an IRCServer in this process in memory
+
+        The client and server have to be run on the same loop, such as
+        an IRC.Host.SessionHost.
+        """
+        self.__loopback = server
+
+    def setReconnect(self, timeout):
+        """ Keep trying to resume the session for timeout seconds
+
+        A timeout of 0 disables reconnecting.
+        """
+        self.__reconnectTimeout = timeout
+
     def connect(self):
         """ Attempt to connect to a given server"""
+        if self.__loopback != None:
+            self.__server = self.__buffer(self.__loopback.connectLoopback())
+            logging.info("Client Connected to server over loopback.")
+            return True
+        if self.__unixPath != None:
+            family = sockmod.AF_UNIX
+            address = self.__unixPath
+        else:
+            family = sockmod.AF_INET
+            address = (self.getHost(), self.getPort())
         try:
             logging.info("Attempting to start client.")
-            self.__server = sockmod.socket(sockmod.AF_INET, sockmod.SOCK_STREAM)
-            self.__server.connect((self.getHost(), self.getPort()))
-            self.__server = SocketBuffer(self.__server)
+            server = sockmod.socket(family, sockmod.SOCK_STREAM)
+            server.connect(address)
+            self.__server = self.__buffer(server)
             logging.info("Client Connected to server.")
             return True
         except sockmod.error as e:
-            if e.errno == 111:
+            if e.errno in (errno.ECONNREFUSED, errno.ENOENT):
                 logging.critical(
-                    "Can't connect to {host}:{port}. Is the server running?".format(
-                        host=self.getHost(),
-                        port=self.getPort()
+                    "Can't connect to {address}. Is the server running?".format(
+                        address=address
                     )
                 )
                 return False
@@ -517,10 +682,41 @@ class IRCClient(IRC.Handler.IRCHandler):
             logging.warning("Screen size too small")
             self.stop()
         else:
+            from IRC.GUI import ClientGUI
             self.__gui = ClientGUI(self, screen)
             self.__gui.update()
             self.run(shutdown=False)
 
+    def getTimeout(self):
+        """ Wake up in time to draw any pending GUI frame"""
+        timeout = super(IRCClient, self).getTimeout()
+        delay = self.__gui.frameDelay()
+        if delay != None:
+            timeout = min(timeout, delay)
+        return timeout
+
+    def timeStep(self):
+        """ Draw pending GUI changes once the frame limit allows"""
+        self.__gui.render()
+
+    def pendingTimeout(self, timeout):
+        """ Also wake up in time to retry reconnecting to the server"""
+        timeout = super(IRCClient, self).pendingTimeout(timeout)
+        if self.__reconnectAt != None:
+            retry = max(0, self.__reconnectAt - time.time())
+            timeout = retry if timeout == None else min(timeout, retry)
+        return timeout
+
+    def runPending(self):
+        """ Give pending sockets their next turn
+
+        Then retries reconnecting to the server when due. Bots override
+        timeStep, so the retries are run from here instead.
+        """
+        super(IRCClient, self).runPending()
+        if self.__reconnectAt != None and time.time() >= self.__reconnectAt:
+            self.__reconnect()
+
     def setInput(self, newinput):
         """ Sets the input stream for the client"""
         self.__input = newinput
@@ -544,7 +740,10 @@ class IRCClient(IRC.Handler.IRCHandler):
 
     def getInputSocketList(self):
         """ Returns  the list of input sockets to listen"""
-        return [self.__input, self.__server]
+        inputs = [] if self.__disconnected else [self.__server]
+        if self.__input == None:
+            return inputs
+        return [self.__input] + inputs
 
     def getOutputSocketList(self):
         """Returns a list of sockets ready to send messages"""
@@ -563,6 +762,17 @@ class IRCClient(IRC.Handler.IRCHandler):
         except CommandParseError as e:
             self.notify("Error Encountered Parsing Command: %s" % (e))
 
+    def inputScript(self, script):
+        """ Execute every command line of a script
+
+        The resulting messages are all queued on the server socket
+        before the handler runs, so they are sent pipelined instead of
+        one line per pass through the select loop.
+        """
+        for line in script:
+            if len(line.strip()) > 0:
+                self.inputCmd(line)
+
     def socketInputReady(self, socket):
         """ Determine what to do with a given socket input"""
         if socket == self.__input:
@@ -577,13 +787,75 @@ class IRCClient(IRC.Handler.IRCHandler):
         pass  #does the client care?
 
     def connectionDrop(self, socket):
-        """ Server Disconnect, shutdown client. """
+        """ Server Disconnect, resume the session or shutdown client. """
         if socket == self.__server:
             self.notify("*** Server Disconnect ***")
-
-        if self.__autoQuit and socket == self.__server:
+            if (self.__token != None and self.__reconnectTimeout > 0 and
+                    self.isRunning() and not self.__quitting):
+                self.__disconnected = True
+                self.__reconnectBy = time.time() + self.__reconnectTimeout
+                self.__reconnect()
+                return
+
+        if (self.__autoQuit or self.__quitting) and socket == self.__server:
             self.stop()
 
+    def quitting(self):
+        """ The user asked to quit, don't resume once the server closes"""
+        self.__quitting = True
+
+    def isResuming(self):
+        """ Is the client waiting on the server to resume its session?"""
+        return self.__resuming
+
+    def __reconnect(self):
+        """ Try to reconnect and resume the session
+
+        Failed attempts are retried every RECONNECT_DELAY seconds until
+        the reconnect timeout.
+        """
+        self.__reconnectAt = None
+        try:
+            connected = self.connect()
+        except sockmod.error as e:
+            logging.warning("Reconnect failed: {e}".format(e=e))
+            connected = False
+
+        if connected:
+            self.__disconnected = False
+            self.__resuming = True
+            self.sendMsg(self.__server, self._ircmsg.cmdResume(self.__token))
+            self.notify("*** Reconnected, resuming session ***")
+        elif time.time() + RECONNECT_DELAY < self.__reconnectBy:
+            self.__reconnectAt = time.time() + RECONNECT_DELAY
+        else:
+            self.__token = None
+            self.notify("*** Unable to reconnect ***")
+            if self.__autoQuit:
+                self.stop()
+
+    def __rejoin(self):
+        """ Start over on the new connection, as our session is gone
+
+        Takes the name the server gave the connection, then asks for
+        our name back and rejoins our channels with the membership
+        versions known, so only the changes are sent.
+        """
+        nick = self.__nick
+        me = self.findOrCreateUser(nick)
+        joined = [c for c in self.getJoined() if c != self.__noneChannel]
+        for c in joined:
+            c.removeUser(me)
+            c.setSynced(False)
+        if self.__tempNick != None:
+            self.receivedNick(self.__server, nick, self.__tempNick)
+            self.sendMsg(self.__server, self._ircmsg.cmdNick(nick))
+        if len(joined):
+            channels = sorted([c.getName() for c in joined])
+            self.sendMsg(self.__server, self._ircmsg.cmdJoin(
+                channels, since=self.knownVersions(channels)
+            ))
+
     def notify(self, msg):
         """ Notify the GUI that there is a new message """
         self.updateChat(msg)
@@ -628,6 +900,11 @@ class IRCClient(IRC.Handler.IRCHandler):
         If it's for the client, update the nickname.
         Otherwise update the nickname of the specified clients
         """
+        if self.__resuming and src == "NEWUSER":
+            #The new connection's name, only needed if resuming fails
+            self.__tempNick = newnick
+            return
+
         notify = self.allChannelsWithName(src)
         user = self.findOrCreateUser(src)
         user.updateName(newnick)
@@ -663,7 +940,11 @@ class IRCClient(IRC.Handler.IRCHandler):
         """
         user = self.findOrCreateUser(src)
         if src == "SERVER":
+            #The server ended every session, ours can't be resumed
+            self.__token = None
             notify = self.__allChannels.values()
+            for c in notify:
+                c.setSynced(False)
         else:
             notify = self.allChannelsWithName(src)
             for c in notify:
@@ -688,7 +969,20 @@ class IRCClient(IRC.Handler.IRCHandler):
         """ Unused server command """
         pass
 
-    def receivedJoin(self, socket, src, channels):
+    def receivedSession(self, socket, token):
+        """ Keep the token to resume the session with"""
+        self.__token = token
+
+    def receivedResume(self, socket, src, token):
+        """ The server resumed our session, with a token for next time"""
+        self.__token = token
+        self.__resuming = False
+        self.__tempNick = None
+        self.notify("*** Resumed session as {nick} ***".format(
+            nick=self.__nick
+        ))
+
+    def receivedJoin(self, socket, src, channels, since):
         """ Received join
 
         If the join is for the user, add them to the channel.
@@ -728,8 +1022,12 @@ class IRCClient(IRC.Handler.IRCHandler):
                 chan.removeUser(user)
                 notify_chan.append(chan)
 
-        if src == self.__nick and self.__currentChannel in notify_chan:
-            self.__currentChannel = self.__noneChannel
+        if src == self.__nick:
+            #Changes to the channels are no longer sent to us
+            for c in notify_chan:
+                c.setSynced(False)
+            if self.__currentChannel in notify_chan:
+                self.__currentChannel = self.__noneChannel
 
         self.updateChat(
             "*** {src} left the channel(s) {chans} ({msg})".format(
@@ -747,7 +1045,7 @@ class IRCClient(IRC.Handler.IRCHandler):
         pass
 
     @clientIgnore
-    def receivedUsers(self, socket, channels, client_req):
+    def receivedUsers(self, socket, channels, client_req, since):
         """ Client does not receive users requests"""
         pass
 
@@ -774,22 +1072,54 @@ class IRCClient(IRC.Handler.IRCHandler):
         """ Client does not recieve pongs"""
         pass
 
-    def receivedNames(self, socket, channel, names, client):
+    def receivedNames(self, socket, channel, names, client, version):
         """ Receive the names list
 
-        If the user is in GUI mode, update the users window.
-        Otherwise print out the user information
+        Names are collected per request and channel until the empty
+        reply ends the list, so replies to several requests in flight
+        don't mix. If the user is in GUI mode, update the users window.
+        Otherwise print out the user information. A versioned list of
+        a channel we are in is kept current from then on.
         """
+        key = (self.getRequestId(), channel)
+        self.__tempNames.setdefault(key, []).extend(names)
+        if len(names) > 0:
+            return
+
+        names = self.__tempNames.pop(key)
+        if (self.__gui.isGUI() and not client) or version != None:
+            c = self.findOrCreateChannel(channel)
+            c.receivedNames([self.findOrCreateUser(n) for n in names], version)
+            c.setSynced(
+                version != None and
+                c.userInChannel(self.findOrCreateUser(self.__nick))
+            )
+        self.showNames(channel, names, client)
+
+    def receivedDelta(self, socket, channel, version, added, removed, client):
+        """ Receive the members changed since our version of a channel
+
+        Like names, the changes are collected until the empty reply,
+        then applied to our list of users, which is shown in full.
+        """
+        key = (self.getRequestId(), channel)
+        (adds, removes) = self.__tempDeltas.setdefault(key, ([], []))
+        adds.extend(added)
+        removes.extend(removed)
+        if len(added) > 0 or len(removed) > 0:
+            return
+
+        del self.__tempDeltas[key]
+        c = self.findOrCreateChannel(channel)
+        c.receivedDelta(
+            [self.findOrCreateUser(n) for n in adds], removes, version
+        )
+        c.setSynced(c.userInChannel(self.findOrCreateUser(self.__nick)))
+        self.showNames(channel, [u.getName() for u in c.userList()], client)
+
+    def showNames(self, channel, names, client):
+        """ Show a complete names list of a channel"""
         if self.__gui.isGUI() and not client:
-            self.__tempNames.extend(names)
-            if len(names) == 0:
-                c = self.findOrCreateChannel(channel)
-                newusers = []
-                for n in self.__tempNames:
-                    newusers.append(self.findOrCreateUser(n))
-                c.receivedNames(newusers)
-
-                self.__tempNames = []
             self.__gui.update()
         elif len(names) > 0:
             self.notify(
@@ -802,38 +1132,50 @@ class IRCClient(IRC.Handler.IRCHandler):
     def receivedChannelsReply(self, socket, channels):
         """ Receive the channels list
 
-        If the user is in gui mode update the channels window.
+        Channels are collected per request until the empty reply ends
+        the list. If the user is in gui mode update the channels window.
         Otherwise print out the channels list.
         """
+        key = self.getRequestId()
+        self.__tempChannels.setdefault(key, []).extend(channels)
+        if len(channels) > 0:
+            return
+
+        channels = self.__tempChannels.pop(key)
         if self.__gui.isGUI():
-            self.__tempChannels.extend(channels)
-
-            if channels == []:
-                new_set = set(self.__tempChannels)
-                old_set = set(self.__allChannels.keys())
-                remove = old_set - new_set
-                add = new_set - old_set
-                for d in remove:
-                    del self.__allChannels[d]
-                for a in add:
-                    self.findOrCreateChannel(a)
-
-                self.__gui.update()
+            new_set = set(channels)
+            old_set = set(self.__allChannels.keys())
+            remove = old_set - new_set
+            add = new_set - old_set
+            for d in remove:
+                del self.__allChannels[d]
+            for a in add:
+                self.findOrCreateChannel(a)
+
+            self.__gui.update()
         elif len(channels) > 0:
             self.notify("CHANNELS: {chans}".format(chans=" ".join(channels)))
 
     def receivedError(self, socket, error_name, error_msg):
-        """ Notify user of error"""
+        """ Notify user of error
+
+        If our session could not be resumed, start over.
+        """
         self.notify(
             "ERROR: {error_t}: {error_m}".format(
                 error_t=error_name,
                 error_m=error_msg
             )
         )
+        if error_name == 'nosession' and self.__resuming:
+            self.__resuming = False
+            self.__rejoin()
 
-    def receivedInvalid(self, socket, msg):
+    def receivedInvalid(self, socket, msg, error):
         """ Notify user of invalid server message"""
-        self.notify("BAD SERVER MSG: {msg}".format(msg=msg))
+        self.notify("BAD SERVER MSG ({error}): {msg}".format(
+            error=error, msg=msg
+        ))
 
     def receivedSignal(self, sig, frame):
         """ Handle signal gradefully """
@@ -853,12 +1195,131 @@ class IRCClient(IRC.Handler.IRCHandler):
         self.__server.close()
 
 
+class HeadlessClient(IRCClient):
+    """ A lean IRC Client for bots
+
+    Nothing is printed or kept in channel histories, other users are
+    not tracked and the server's messages are trusted without being
+    validated. A bot registers callbacks for the events it needs:
+
+    msg(src, targets, msg), join(src, channels),
+    leave(src, channels, msg), nick(src, newnick), quit(src, msg),
+    names(channel, names), channels(channels), error(name, msg)
+    """
+    EVENTS = (
+        'msg', 'join', 'leave', 'nick', 'quit', 'names', 'channels', 'error'
+    )
+
+    def __init__(self, host, port, autoQuit=True):
+        """ Initialize Client without user input"""
+        super(HeadlessClient, self).__init__(
+            host, port, None, autoQuit, TrustedSocketBuffer
+        )
+        self.__callbacks = {}
+        #Partial names/channels replies by (request id, channel)
+        self.__lists = {}
+
+    def on(self, event, fn):
+        """ Call fn with the event's arguments whenever it occurs"""
+        if event not in self.EVENTS:
+            raise ValueError("Unknown event {e}".format(e=event))
+        self.__callbacks.setdefault(event, []).append(fn)
+
+    def __emit(self, event, *args):
+        """ Call the callbacks of an event"""
+        for fn in self.__callbacks.get(event, ()):
+            fn(*args)
+
+    def __collect(self, key, items):
+        """ Collect partial replies, returns the list once it is complete"""
+        self.__lists.setdefault(key, []).extend(items)
+        if len(items) > 0:
+            return None
+        return self.__lists.pop(key)
+
+    def updateChat(self, msg, channels=None):
+        """ Headless clients neither show nor keep chat messages"""
+        pass
+
+    def receivedNick(self, socket, src, newnick):
+        """ Track our own nickname only"""
+        resuming = self.isResuming()
+        if src == self.getNick() or src == "NEWUSER":
+            super(HeadlessClient, self).receivedNick(socket, src, newnick)
+        if not (resuming and src == "NEWUSER"):
+            self.__emit('nick', src, newnick)
+
+    def receivedQuit(self, socket, src, msg):
+        """ Track our own quit or the server's only"""
+        if src == self.getNick() or src == "SERVER":
+            super(HeadlessClient, self).receivedQuit(socket, src, msg)
+        self.__emit('quit', src, msg)
+
+    def receivedJoin(self, socket, src, channels, since):
+        """ Track the channels we joined only"""
+        if src == self.getNick():
+            super(HeadlessClient, self).receivedJoin(
+                socket, src, channels, since
+            )
+        self.__emit('join', src, channels)
+
+    def receivedLeave(self, socket, src, channels, msg):
+        """ Track the channels we left only"""
+        if src == self.getNick():
+            super(HeadlessClient, self).receivedLeave(
+                socket, src, channels, msg
+            )
+        self.__emit('leave', src, channels, msg)
+
+    def receivedMsg(self, socket, src, targets, msg):
+        """ Pass the message on to the callbacks"""
+        self.__emit('msg', src, targets, msg)
+
+    def receivedNames(self, socket, channel, names, client, version):
+        """ Pass complete names lists on to the callbacks"""
+        names = self.__collect((self.getRequestId(), channel), names)
+        if names != None:
+            self.__emit('names', channel, names)
+
+    def receivedDelta(self, socket, channel, version, added, removed, client):
+        """ Unused, membership versions are not tracked to ask for deltas"""
+        pass
+
+    def receivedChannelsReply(self, socket, channels):
+        """ Pass complete channels lists on to the callbacks"""
+        channels = self.__collect((self.getRequestId(), None), channels)
+        if channels != None:
+            self.__emit('channels', channels)
+
+    def receivedError(self, socket, error_name, error_msg):
+        """ Pass errors on to the callbacks"""
+        super(HeadlessClient, self).receivedError(socket, error_name, error_msg)
+        self.__emit('error', error_name, error_msg)
+
+
 def main():
     """ Main entry point for IRC Client"""
     parser = argparse.ArgumentParser(description="IRC Client")
     parser.add_argument('--hostname', help="Hostname", default="localhost")
     parser.add_argument('--port', type=int, help="Port", default=50000)
+    parser.add_argument(
+        '--unix',
+        default=None,
+        help="Connect to the server's unix socket path instead"
+    )
     parser.add_argument('--gui', action='store_true')
+    parser.add_argument(
+        '--script',
+        default=None,
+        help="Send the commands in a file ('-' for stdin) and exit"
+    )
+    parser.add_argument(
+        '--reconnect',
+        type=float,
+        default=RECONNECT_TIMEOUT,
+        help="Seconds to try resuming the session after a disconnect "
+        "(0 disables)"
+    )
     parser.add_argument('--log', default=None)
 
     args = parser.parse_args()
@@ -870,9 +1331,25 @@ def main():
             level=logging.DEBUG
         )
 
-    client = IRCClient(args.hostname, args.port)
+    if args.script != None:
+        client = IRCClient(args.hostname, args.port, None, autoQuit=True)
+    else:
+        client = IRCClient(args.hostname, args.port)
+
+    if args.unix != None:
+        client.setUnixPath(args.unix)
+    client.setReconnect(args.reconnect)
     if client.connect():
-        if args.gui:
+        if args.script != None:
+            if args.script == '-':
+                client.inputScript(sys.stdin)
+            else:
+                with open(args.script) as script:
+                    client.inputScript(script)
+            client.inputCmd("/quit Script finished\n")
+            client.run()
+        elif args.gui:
+            import curses
             #keep the client running even if the GUI needs to redraw
             while client.isRunning():
                 curses.wrapper(client.guirun)
@@ -0,0 +1,47 @@
+"""
+IRC.Console
+
+Provides the console interface of a client without a GUI. It is
+kept apart from IRC.GUI so headless clients don't load curses.
+"""
+
+
+class ClientConsole(object):
+    """ A generic console implementation stub to allow the
+    subclassing of a GUI Client implementation"""
+
+    def __init__(self, client):
+        """ Initialize Default Console View"""
+        self._client = client
+
+    def isGUI(self):
+        """ Not running GUI"""
+        return False
+
+    def update(self):
+        """ Stub """
+        pass
+
+    def updateChat(self):
+        """ Stub """
+        pass
+
+    def updateUsers(self):
+        """ Stub """
+        pass
+
+    def updateChannels(self):
+        """ Stub """
+        pass
+
+    def render(self):
+        """ Stub """
+        pass
+
+    def frameDelay(self):
+        """ No frames are ever pending """
+        return None
+
+    def keypress(self):
+        """ Retreives the clients input"""
+        return self._client.getUserInput()
@@ -7,6 +7,11 @@ for a client
 import curses
 from curses import textpad
 import logging
+import time
+from IRC.Console import ClientConsole
+
+#Maximum number of redraws per second
+MAX_FPS = 20
 
 
 class BorderedWin(object):
@@ -39,54 +44,33 @@ class BorderedWin(object):
         """ Redraw this window"""
         self.__border.border()
         self.__border.addstr(0, 1, self.__title, curses.A_BOLD)
-        self.__border.refresh()
-        self.__win.refresh()
-
-
-class ClientConsole(object):
-    """ A generic console implementation stub to allow the
-    subclassing of a GUI Client implementation"""
-
-    def __init__(self, client):
-        """ Initialize Default Console View"""
-        self._client = client
-
-    def isGUI(self):
-        """ Not running GUI"""
-        return False
-
-    def update(self):
-        """ Stub """
-        pass
-
-    def updateChat(self):
-        """ Stub """
-        pass
-
-    def updateUsers(self):
-        """ Stub """
-        pass
-
-    def updateChannels(self):
-        """ Stub """
-        pass
-
-    def keypress(self):
-        """ Retreives the clients input"""
-        return self._client.getUserInput()
+        self.__border.noutrefresh()
+        self.__win.noutrefresh()
 
 
 class ClientGUI(ClientConsole):
     """ An NCurses implementation of a GUI
 
-    Manages all windows and updates accordingly
+    Manages all windows and tracks which of them are out of date.
+    Changes are only drawn by render, which coalesces them into at
+    most MAX_FPS screen updates per second.
     """
+    CHAT = 'chat'
+    USERS = 'users'
+    CHANNELS = 'channels'
+    BORDERS = 'borders'
 
-    def __init__(self, client, screen):
+    def __init__(self, client, screen, fps=MAX_FPS):
         """ Initialize Curses based GUI Window"""
         super(ClientGUI, self).__init__(client)
         self.__screen = screen
         self.__borders = []
+        self.__frameTime = 1.0 / fps
+        self.__lastFrame = 0
+        self.__dirty = set()
+        #Channel and history count currently shown in the chat window
+        self.__chatChannel = None
+        self.__chatCount = 0
 
         (height, width) = self.__screen.getmaxyx()
         chanB = BorderedWin("Channels", height - 1, 15, 0, 0)
@@ -108,46 +92,82 @@ class ClientGUI(ClientConsole):
         self.__textWin = curses.newwin(1, width, height - 1, 0)
         self.__textPad = textpad.Textbox(self.__textWin)
 
-        self.__allWins = [self.__screen, self.__textWin, ]
-        self.__update()
+        self.__screen.noutrefresh()
+        self.__dirty.update(
+            [self.BORDERS, self.CHAT, self.USERS, self.CHANNELS]
+        )
+        self.render()
 
     def isGUI(self):
         """ Client is running in GUI mode"""
         return True
 
-    def __update(self):
-        """ Update all the windows on screen"""
-        for b in self.__borders:
-            b.redraw()
-
-        for w in self.__allWins:
-            w.refresh()
-
     def update(self):
-        """ Redraw all windows and update screen"""
-        self.__redrawChat()
-        self.__redrawUsers()
-        self.__redrawChannels()
-        self.__update()
+        """ Mark all windows as out of date """
+        self.__dirty.update([self.CHAT, self.USERS, self.CHANNELS])
+        self.render()
+
+    def frameDelay(self):
+        """ Seconds until pending changes may be drawn (None if up to date)"""
+        if not self.__dirty:
+            return None
+        return max(0, self.__lastFrame + self.__frameTime - time.time())
+
+    def render(self, force=False):
+        """ Draw any out of date windows
+
+        Rendering is skipped if the last frame was drawn too recently,
+        the client will call render again once frameDelay has passed.
+        """
+        if not self.__dirty or (not force and self.frameDelay() > 0):
+            return
+
+        if self.BORDERS in self.__dirty:
+            for b in self.__borders:
+                b.redraw()
+        if self.CHAT in self.__dirty:
+            self.__redrawChat()
+        if self.USERS in self.__dirty:
+            self.__redrawUsers()
+        if self.CHANNELS in self.__dirty:
+            self.__redrawChannels()
+
+        #The text window is last so the cursor is left on the input line
+        self.__textWin.noutrefresh()
+        curses.doupdate()
+        self.__dirty.clear()
+        self.__lastFrame = time.time()
 
     def __redrawChat(self):
-        """ Redraw the chat messages window"""
-        self.__chatWin.clear()
-        chats = self._client.currentChannel().chatHistory()
-        count = min(len(chats), self.__chatWin.getmaxyx()[0])
-        shown = chats[-count:]
-        for c in shown:
-            self.__chatWin.addstr(c + "\n")
+        """ Bring the chat messages window up to date
+
+        If the same channel is still shown only the lines added since
+        the last frame are appended, and the window scrolls by itself.
+        """
+        channel = self._client.currentChannel()
+        chats = channel.chatHistory()
+        total = channel.historyCount()
+        new = total - self.__chatCount
+        if channel != self.__chatChannel or new > len(chats):
+            self.__chatWin.erase()
+            new = len(chats)
+
+        count = min(new, self.__chatWin.getmaxyx()[0])
+        if count > 0:
+            for c in chats[-count:]:
+                self.__chatWin.addstr(c + "\n")
+        self.__chatWin.noutrefresh()
+        self.__chatChannel = channel
+        self.__chatCount = total
 
-        self.__update()
-
-    def updateChat(self, ):
-        """ Update the chat window on screen"""
-        self.__redrawChat()
+    def updateChat(self):
+        """ Mark the chat window as out of date"""
+        self.__dirty.add(self.CHAT)
+        self.render()
 
     def __redrawUsers(self):
         """ Redraw the users window on screen"""
-        self.__userWin.clear()
+        self.__userWin.erase()
 
         all_users = [u for u in self._client.currentChannel().userList()]
         all_users.sort(key=lambda u: u.getName())
@@ -155,24 +175,26 @@ class ClientGUI(ClientConsole):
         all_users = all_users[:count]
         for user in all_users:
             self.__userWin.addstr(user.getName() + "\n")
+        self.__userWin.noutrefresh()
 
     def updateUsers(self):
-        """ Update the users window on screeen"""
-        self.__redrawUsers()
-        self.__update()
+        """ Mark the users window as out of date"""
+        self.__dirty.add(self.USERS)
+        self.render()
 
     def __redrawChannels(self):
         """ Redraw the channels window"""
-        self.__channelWin.clear()
+        self.__channelWin.erase()
         all_chans = self._client.getChannels()
         all_chans.sort(key=lambda c: c.getName())
         count = min(len(all_chans), self.__channelWin.getmaxyx()[0])
         show = all_chans[:count]
+        joined = self._client.getJoined()
         for c in show:
             cur = self._client.currentChannel() == c
             if cur:
                 attr = curses.A_REVERSE
-            elif c in self._client.getJoined():
+            elif c in joined:
                 attr = curses.A_BOLD
             else:
                 attr = curses.A_DIM
@@ -181,11 +203,12 @@ class ClientGUI(ClientConsole):
                     "{chan}\n".format(chan=c.getName()),
                     attr
                 )
+        self.__channelWin.noutrefresh()
 
     def updateChannels(self):
-        """ Update the channels window"""
-        self.__redrawChannels()
-        self.__update()
+        """ Mark the channels window as out of date"""
+        self.__dirty.add(self.CHANNELS)
+        self.render()
 
     def keypress(self):
         """ Recieve keypress from textpad and return string if recieved"""
@@ -193,9 +216,11 @@ class ClientGUI(ClientConsole):
         ret = None
         if k == curses.KEY_ENTER or (k < 256 and chr(k) == '\n'):
             ret = self.__textPad.gather()
-            self.__textWin.clear()
+            self.__textWin.erase()
         else:
             self.__textPad.do_command(k)
 
-        self.__update()
+        #Only the input line changed, leave the other windows alone
+        self.__textWin.noutrefresh()
+        curses.doupdate()
         return ret
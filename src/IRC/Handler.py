@@ -5,21 +5,113 @@ socket connections and the data handling with those
 sockets. It additionally provides high level knowledge
 of incoming/outgoing commands.
 """
-import jsonschema
 from abc import ABCMeta, abstractmethod
 import signal
 import select
 from IRC.Message import IRCMessage
+from IRC.Loopback import LoopbackSocket
 import IRC.Exceptions
-import IRC.Schema
+import IRC.Validator
 import IRC
 import json
 import re
 import socket as sockmod
+import errno
 import logging
+import time
+from collections import OrderedDict, deque
 
 MAX_JSON_MSG = 1024
 RWSIZE = select.PIPE_BUF
+#Every message is an object with one of these keys
+MESSAGE_KEYS = ('"cmd"', '"reply"', '"error"')
+#Classes of messages queued to send, each sent before the next one
+PRIORITY_CONTROL = 0
+PRIORITY_REPLY = 1
+PRIORITY_BULK = 2
+PRIORITIES = 3
+#Commands sent in the control class, the rest are bulk
+CONTROL_CMDS = frozenset(['ping', 'pong', 'squit'])
+
+
+def selectable(s):
+    """ Return the object select should wait on for a socket buffer"""
+    if isinstance(s, SocketBuffer):
+        return s.getSocket()
+    else:
+        return s
+
+
+def priorityOf(msg):
+    """ The class a message is queued to send in
+
+    Keepalives are control messages, replies and errors answer
+    requests, all other commands are bulk. Replies and errors go ahead
+    of bulk queued before them, unless the socket buffer is fenced.
+    """
+    if 'cmd' not in msg:
+        return PRIORITY_REPLY
+    elif msg['cmd'] in CONTROL_CMDS:
+        return PRIORITY_CONTROL
+    return PRIORITY_BULK
+
+
+def waitReady(inputs, outputs, timeout):
+    """ Wait until any of the given selectables are ready
+
+    Uses poll where available, which unlike select is not limited to
+    file descriptors below FD_SETSIZE. Loopback sockets are checked
+    without asking the kernel, they are always ready to send. Returns
+    the lists of inputs and outputs that are ready.
+    """
+    if not hasattr(select, 'poll'):
+        loopIn = [
+            s for s in inputs if type(s) is LoopbackSocket and s.readable()
+        ]
+        loopOut = [s for s in outputs if type(s) is LoopbackSocket]
+        if len(loopIn) or len(loopOut):
+            timeout = 0
+        inputready, outputready, exceptready = select.select(
+            [s for s in inputs if type(s) is not LoopbackSocket],
+            [s for s in outputs if type(s) is not LoopbackSocket], [],
+            timeout
+        )
+        return (loopIn + inputready, loopOut + outputready)
+
+    READ = select.POLLIN | select.POLLPRI | select.POLLHUP | select.POLLERR
+    poller = select.poll()
+    fds = {}
+    masks = {}
+    inputready = []
+    outputready = []
+    for s in inputs:
+        if type(s) is LoopbackSocket:
+            if s.readable():
+                inputready.append(s)
+            continue
+        fd = s if type(s) is int else s.fileno()
+        fds.setdefault(fd, {})['in'] = s
+        masks[fd] = masks.get(fd, 0) | select.POLLIN | select.POLLPRI
+    for s in outputs:
+        if type(s) is LoopbackSocket:
+            outputready.append(s)
+            continue
+        fd = s if type(s) is int else s.fileno()
+        fds.setdefault(fd, {})['out'] = s
+        masks[fd] = masks.get(fd, 0) | select.POLLOUT
+    for (fd, mask) in masks.items():
+        poller.register(fd, mask)
+
+    if len(inputready) or len(outputready):
+        timeout = 0
+    if timeout != None:
+        timeout = timeout * 1000
+    for (fd, event) in poller.poll(timeout):
+        if event & READ and 'in' in fds[fd]:
+            inputready.append(fds[fd]['in'])
+        if event & (select.POLLOUT | select.POLLERR) and 'out' in fds[fd]:
+            outputready.append(fds[fd]['out'])
+    return (inputready, outputready)
 
 
 class SocketBuffer(object):
@@ -27,11 +119,35 @@ class SocketBuffer(object):
     The SocketBuffer provides a wrapper around a socket
     so that messages can be buffered before being sent/
     recieved. It also handles cases like socket disconnection.
+
+    Messages to send are queued in one of PRIORITIES classes, and
+    whole frames are taken from the highest class first, so a ping
+    does not wait behind a backlog of chat. Messages of a class are
+    sent in the order they were added. Once fenced, replies are queued
+    as bulk until the bulk queued before the fence is taken, so they
+    don't overtake the effects of the commands they follow.
     """
+    __slots__ = (
+        '__sendBuffer', '__headSent', '__queues', '__queued', '__recvBuffer',
+        '__socket', '__disconnect', '__broken', '__closed', '__misc',
+        '__notified', '__bucket', '__trace', '__bulkAdded', '__bulkTaken',
+        '__fence'
+    )
 
     def __init__(self, socket, misc=None):
         """ Initialize Socket Buffer"""
+        #Frames being sent, the first one possibly partly sent already
         self.__sendBuffer = ""
+        #Bytes of the first frame in the send buffer already sent
+        self.__headSent = 0
+        #(frame, when it was queued if traced) for each class
+        self.__queues = [deque() for p in xrange(PRIORITIES)]
+        self.__queued = 0
+        #Bulk frames added and taken to send, replies are bulk as long
+        #as fewer than the fence were taken
+        self.__bulkAdded = 0
+        self.__bulkTaken = 0
+        self.__fence = 0
         self.__recvBuffer = ""
         self.__socket = socket
         self.__disconnect = False
@@ -39,11 +155,38 @@ class SocketBuffer(object):
         self.__closed = False
         self.__misc = misc
         self.__notified = False
+        self.__bucket = None
+        self.__trace = None
 
     def getMisc(self):
         """ Return user provided data for socket"""
         return self.__misc
 
+    def setMisc(self, misc):
+        """ Replace the user provided data for socket"""
+        self.__misc = misc
+
+    def setBucket(self, bucket):
+        """ Limit the rate messages are received with a TokenBucket"""
+        self.__bucket = bucket
+
+    def getBucket(self):
+        """ Return the TokenBucket limiting received messages (or None)"""
+        return self.__bucket
+
+    def setTrace(self, trace):
+        """ Follow frames through the buffer with an IRC.Latency.FrameTrace"""
+        self.__trace = trace
+
+    def receivedAt(self):
+        """ When the message last returned by getMsg was received
+
+        Only known while the buffer is traced, otherwise None.
+        """
+        if self.__trace == None:
+            return None
+        return self.__trace.receivedAt()
+
     def accept(self):
         """ Accept connections on this buffer"""
         return self.__socket.accept()
@@ -52,32 +195,105 @@ class SocketBuffer(object):
         """ Socket has been killed in some form"""
         return self.__disconnect or self.__broken or self.__closed
 
+    def isClosed(self):
+        """ Socket was closed locally"""
+        return self.__closed
+
     def readyToSend(self):
         """ Any messages waiting to send"""
-        return not self.isDead() and len(self.__sendBuffer) > 0
+        return not self.isDead() and (
+            len(self.__sendBuffer) > 0 or self.__queued > 0
+        )
+
+    def __fill(self):
+        """ Move whole frames to send from the queues, highest class first
+
+        Only as many as needed to fill the next payload, so that a
+        message queued meanwhile still goes ahead of lower classes.
+        """
+        frames = [self.__sendBuffer]
+        size = len(self.__sendBuffer)
+        for queue in self.__queues:
+            while len(queue) and size < RWSIZE:
+                (frame, when) = queue.popleft()
+                frames.append(frame)
+                size += len(frame)
+                self.__queued -= 1
+                if self.__trace != None:
+                    self.__trace.queued(len(frame), when)
+        bulk = self.__queues[PRIORITY_BULK]
+        self.__bulkTaken = self.__bulkAdded - len(bulk)
+        self.__sendBuffer = "".join(frames)
 
     def send(self):
         """ Attempt to send the buffer size amount of messages"""
         try:
             if not self.isDead():
+                if len(self.__sendBuffer) < RWSIZE and self.__queued > 0:
+                    self.__fill()
                 (payload, self.__sendBuffer) = (
                     self.__sendBuffer[:RWSIZE], self.__sendBuffer[RWSIZE:]
                 )
                 if len(payload):
                     logging.debug("Sending Message: %s" % repr(payload))
-                    self.__socket.send(payload)
+                    sent = self.__socket.send(payload)
+                    if sent < len(payload):
+                        self.__sendBuffer = payload[sent:] + self.__sendBuffer
+                    end = payload.rfind('\n', 0, sent)
+                    if end == -1:
+                        self.__headSent += sent
+                    else:
+                        self.__headSent = sent - end - 1
+                    if self.__trace != None:
+                        self.__trace.sent(sent)
         except sockmod.error:
             self.__broken = True
 
-    def addMessage(self, msg):
-        """ Add a given message to the message queue"""
+    def addMessage(self, msg, priority=PRIORITY_BULK):
+        """ Add a given message to the queue of its class"""
         if not self.isDead():
-            self.__sendBuffer += msg
+            if priority == PRIORITY_REPLY and self.__bulkTaken < self.__fence:
+                priority = PRIORITY_BULK
+            if priority == PRIORITY_BULK:
+                self.__bulkAdded += 1
+            self.__queues[priority].append(
+                (msg, time.time() if self.__trace != None else None)
+            )
+            self.__queued += 1
+
+    def fence(self):
+        """ Queue replies behind the bulk queued so far until it is taken"""
+        self.__fence = self.__bulkAdded
+
+    def __unsent(self):
+        """ The messages not sent yet, in the order they would be sent"""
+        return self.__sendBuffer + "".join(
+            frame for queue in self.__queues for (frame, when) in queue
+        )
+
+    def takeUnsent(self):
+        """ Take the whole messages not sent yet, to send them elsewhere
+
+        The rest of a frame already partly sent is dropped, the peer
+        got its start on this socket.
+        """
+        unsent = self.__unsent()
+        if self.__headSent > 0:
+            unsent = unsent.partition('\n')[2]
+        if self.__trace != None:
+            self.__trace.skipped(len(self.__sendBuffer))
+        self.__sendBuffer = ""
+        self.__headSent = 0
+        for queue in self.__queues:
+            queue.clear()
+        self.__queued = 0
+        self.__bulkAdded = self.__bulkTaken = self.__fence = 0
+        return unsent
 
     def close(self):
         """ Close the socket"""
         if not self.isDead():
-            while len(self.__sendBuffer):
+            while self.readyToSend():
                 self.send()
             self.__socket.close()
 
@@ -138,6 +354,25 @@ class SocketBuffer(object):
             else:
                 return None
 
+    def decode(self, msg):
+        """ Decode a message from getMsg
+
+        Returns the message and None, or None and why it is invalid.
+        Cheap structural checks reject most garbage before decoding.
+        """
+        frame = msg.strip()
+        if frame[:1] != '{' or frame[-1:] != '}':
+            return (None, "Not a JSON object")
+        if not any(k in frame for k in MESSAGE_KEYS):
+            return (None, "No cmd, reply or error")
+        try:
+            jmsg = json.loads(frame)
+        except ValueError as e:
+            return (None, str(e))
+        if not IRC.Validator.isValid(jmsg):
+            return (None, "Does not follow the IRC schema")
+        return (jmsg, None)
+
     def recv(self):
         """ Recv data from socket when available """
         if self.isDead():
@@ -150,6 +385,8 @@ class SocketBuffer(object):
                     self.__disconnect = True
                 else:
                     self.__recvBuffer += recvd
+                    if self.__trace != None:
+                        self.__trace.received()
             except sockmod.error:
                 self.__broken = True
                 self.__disconnect = True
@@ -157,6 +394,35 @@ class SocketBuffer(object):
     def getSocket(self):
         return self.__socket
 
+    def snapshot(self):
+        """ Return the unprocessed buffer contents"""
+        return {
+            'send': self.__unsent(), 'head': self.__headSent,
+            'recv': self.__recvBuffer
+        }
+
+    def restore(self, snapshot):
+        """ Restore buffer contents taken from another SocketBuffer"""
+        self.__sendBuffer = snapshot['send']
+        self.__headSent = snapshot.get('head', 0)
+        self.__recvBuffer = snapshot['recv']
+
+
+class TrustedSocketBuffer(SocketBuffer):
+    """ A SocketBuffer to a peer whose messages are trusted
+
+    Received messages are only decoded, not checked against the IRC
+    schema, which is most of the cost of receiving a message.
+    """
+    __slots__ = ()
+
+    def decode(self, msg):
+        """ Decode a message from getMsg without validating it"""
+        try:
+            return (json.loads(msg), None)
+        except ValueError as e:
+            return (None, str(e))
+
 
 class IRCHandler(object):
     """
@@ -181,25 +447,31 @@ class IRCHandler(object):
             'squit':
             lambda s, msg: self.receivedSQuit(s, msg['msg']),
             'join':
-            lambda s, msg: self.receivedJoin(s, msg['src'], msg['channels']),
+            lambda s, msg: self.receivedJoin(s, msg['src'], msg['channels'], msg.get('since', {})),
             'leave':
             lambda s, msg: self.receivedLeave(s, msg['src'], msg['channels'], msg['msg']),
             'channels':
             lambda s, msg: self.receivedChannels(s),
             'users':
-            lambda s, msg: self.receivedUsers(s, msg['channels'], msg['client']),
+            lambda s, msg: self.receivedUsers(s, msg['channels'], msg['client'], msg.get('since', {})),
             'ping':
             lambda s, msg: self.receivedPing(s, msg['msg']),
             'pong':
             lambda s, msg: self.receivedPong(s, msg['msg']),
             'msg':
             lambda s, msg: self.receivedMsg(s, msg['src'], msg['targets'], msg['msg']),
+            'session':
+            lambda s, msg: self.receivedSession(s, msg['token']),
+            'resume':
+            lambda s, msg: self.receivedResume(s, msg['src'], msg['token']),
         } # yapf: disable
         replies = {
             'channels':
             lambda s, msg: self.receivedChannelsReply(s, msg['channels']),
             'names':
-            lambda s, msg: self.receivedNames(s, msg['channel'], msg['names'], msg['client']),
+            lambda s, msg: self.receivedNames(s, msg['channel'], msg['names'], msg['client'], msg.get('version')),
+            'delta':
+            lambda s, msg: self.receivedDelta(s, msg['channel'], msg['version'], msg['added'], msg['removed'], msg['client']),
         } # yapf: disable
         errors = {
             'error':
@@ -209,6 +481,19 @@ class IRCHandler(object):
         self.__running = True
         self.__timeout = 2
         self.__socketBuffers = {}
+        #Rate limited sockets with unprocessed messages -> time to resume
+        self.__throttled = {}
+        #Sockets that used their budget with messages left, in turn order
+        self.__backlog = OrderedDict()
+        self.__budget = None
+        #TraceRecorder of received frames (or None)
+        self.__recorder = None
+        #IRC.Latency.LoopMonitor of the run loop (or None)
+        self.__monitor = None
+        #Request id of the message being handled
+        self.__requestId = None
+        #Socket buffer the message being handled came from
+        self.__requester = None
         self.__host = host
         self.__port = port
         self.__handlers = {'cmd': cmds, 'reply': replies, 'error': errors, }
@@ -231,6 +516,10 @@ class IRCHandler(object):
         """ Update the desired timeout"""
         self.__timeout = timeout
 
+    def getTimeout(self):
+        """ Get the timeout for the next select"""
+        return self.__timeout
+
     def getIRCMsg(self):
         """ Get the IRC Message Sender"""
         return self._ircmsg
@@ -239,41 +528,134 @@ class IRCHandler(object):
         """ Is Handler running?"""
         return self.__running
 
-    def run(self, shutdown=True):
-        """ Run the handler and process messages"""
+    def startup(self):
+        """ Called once before the handler starts processing messages"""
+        pass
 
-        def maybeSocket(s):
-            if type(s) is SocketBuffer:
-                return s.getSocket()
-            else:
-                return s
+    def dispatch(self, inputready, outputready, exceptready):
+        """ Handle the socket buffers select found to be ready"""
+        try:
+            for s in inputready:
+                self.socketInputReady(s)
+            for s in outputready:
+                s.send()
+            for s in exceptready:
+                self.socketExceptReady(s)
+        except IRC.Exceptions.InvalidIRCMessage as e:
+            self.sentInvalid(e.socket, e.msg)
+
+    def setBudget(self, budget):
+        """ Limit the messages handled per socket per loop iteration
+
+        A socket with messages left over waits for its next turn, so a
+        client sending a large burst can't delay everyone else. None
+        means no limit.
+        """
+        self.__budget = budget
+
+    def setRecorder(self, recorder):
+        """ Record every frame received to an IRC.Trace.TraceRecorder
+
+        None stops recording.
+        """
+        self.__recorder = recorder
+
+    def setLoopMonitor(self, monitor):
+        """ Measure the run loop with an IRC.Latency.LoopMonitor
+
+        None stops measuring.
+        """
+        self.__monitor = monitor
+
+    def getLoopMonitor(self):
+        """ Get the LoopMonitor of the run loop (or None)"""
+        return self.__monitor
+
+    def isOverloaded(self):
+        """ Is the run loop falling behind?"""
+        return self.__monitor != None and self.__monitor.isOverloaded()
+
+    def pendingTimeout(self, timeout):
+        """ Shorten timeout to get back to pending sockets in time
+
+        A timeout of None waits without limit.
+        """
+        if len(self.__backlog):
+            return 0
+        if len(self.__throttled):
+            resume = min(self.__throttled.values()) - time.time()
+            if timeout != None:
+                resume = min(timeout, resume)
+            timeout = max(0, resume)
+        return timeout
+
+    def isPending(self, socket):
+        """ Does the socket have buffered messages waiting on a turn?"""
+        return socket in self.__throttled or socket in self.__backlog
+
+    def runPending(self):
+        """ Give pending sockets their next turn
+
+        Each socket in the backlog gets one more budget of messages,
+        in round-robin order, as do throttled sockets with tokens again.
+        """
+        now = time.time()
+        resume = [s for (s, t) in self.__throttled.items() if t <= now]
+        for s in resume:
+            del self.__throttled[s]
+        for s in self.__backlog.keys():
+            del self.__backlog[s]
+            resume.append(s)
+
+        for s in resume:
+            if s.isClosed():
+                continue
+            try:
+                self.processMsgs(s)
+            except IRC.Exceptions.InvalidIRCMessage as e:
+                self.sentInvalid(e.socket, e.msg)
 
+    def run(self, shutdown=True):
+        """ Run the handler and process messages"""
         logging.info("RUN")
+        self.startup()
         try:
             while self.__running:
+                began = time.time()
+                #Pending sockets are not read, pushing back on the sender
+                inputs = [
+                    s for s in self.getInputSocketList()
+                    if not self.isPending(s)
+                ]
+                outputs = self.getOutputSocketList()
+                sockets = {selectable(k): k for k in inputs + outputs}
+                #logging.debug(
+                #    "Running Select %d %d Timeout %f" %
+                #    (len(inputs), len(outputs), self.__timeout)
+                #)
+                polled = time.time()
                 try:
-                    inputs = self.getInputSocketList()
-                    outputs = self.getOutputSocketList()
-                    sockets = {maybeSocket(k): k for k in inputs + outputs}
-                    #logging.debug(
-                    #    "Running Select %d %d Timeout %f" %
-                    #    (len(inputs), len(outputs), self.__timeout)
-                    #)
-                    inputready, outputready, exceptready = select.select(
-                        map(lambda x: maybeSocket(x), inputs),
-                        map(lambda x: maybeSocket(x), outputs), [],
-                        self.__timeout
+                    inputready, outputready = waitReady(
+                        map(selectable, inputs), map(selectable, outputs),
+                        self.pendingTimeout(self.getTimeout())
                     )
-                    for s in inputready:
-                        self.socketInputReady(sockets[s])
-                    for s in outputready:
-                        sockets[s].send()
-                    for s in exceptready:
-                        self.socketExceptReady(sockets[s])
-                except IRC.Exceptions.InvalidIRCMessage as e:
-                    self.sentInvalid(e.socket, e.msg)
+                except select.error as e:
+                    if e[0] != errno.EINTR:
+                        raise
+                    continue  # A signal handler ran, and may have stopped us
+                woke = time.time()
+                self.dispatch(
+                    [sockets[s] for s in inputready],
+                    [sockets[s] for s in outputready], []
+                )
+                self.runPending()
 
                 self.timeStep()
+                if self.__monitor != None:
+                    done = time.time()
+                    busy = (polled - began) + (done - woke)
+                    if self.__monitor.iteration(busy, done):
+                        self.overloadChanged(self.__monitor.isOverloaded())
         except select.error as e:
             if e[0] == 4:  #interrupted system call
                 pass
@@ -283,62 +665,117 @@ class IRCHandler(object):
         #    print "*** Received Keyboard Interrupt ***"
         #    pass
         finally:
+            #Flushed first, a handoff replacement appends to the trace
+            if self.__recorder != None:
+                self.__recorder.close()
+                self.__recorder = None
             if shutdown:
                 logging.info("Server shutting down")
                 self.shutdown()
 
-    def sendMsg(self, socket, msg):
-        """ Attempt to send a message on the socket buffer"""
-        try:
-            jsonschema.validate(msg, IRC.Schema.DEFN)
-            jmsg = json.dumps(msg, separators=(',', ':')) + "\r\n"
-            if len(jmsg) > 1024:
-                raise IRC.Exceptions.InvalidIRCMessage(
-                    socket, "JSON IRC Message Too Long"
-                )
-        except jsonschema.exceptions.ValidationError:
+    def encodeMsg(self, socket, msg):
+        """ Validate and encode a message to send on the socket buffer
+
+        The frame can be added to any number of socket buffers.
+        """
+        if not IRC.Validator.isValid(msg):
             raise IRC.Exceptions.InvalidIRCMessage(socket, msg)
-        else:
-            socket.addMessage(jmsg)
+        jmsg = json.dumps(msg, separators=(',', ':')) + "\r\n"
+        if len(jmsg) > 1024:
+            raise IRC.Exceptions.InvalidIRCMessage(
+                socket, "JSON IRC Message Too Long"
+            )
+        return jmsg
+
+    def sendMsg(self, socket, msg, priority=None):
+        """ Attempt to send a message on the socket buffer
+
+        The message is queued in the class priorityOf gives it, unless
+        another priority is given. Bulk sent back to the socket of the
+        message being handled fences it, so the replies that follow are
+        not sent before it.
+        """
+        if priority == None:
+            priority = priorityOf(msg)
+        socket.addMessage(self.encodeMsg(socket, msg), priority)
+        if priority == PRIORITY_BULK and socket is self.__requester:
+            socket.fence()
 
     def processIRCMsg(self, socket, msg):
         """ Processes a byte string into a message and calls handler"""
-        try:
-            jmsg = json.loads(msg)
-        except ValueError:
-            self.receivedInvalid(socket, msg)
+        (jmsg, error) = socket.decode(msg)
+        if jmsg == None:
+            self.receivedInvalid(socket, msg, error)
             return
 
+        self.__requestId = jmsg.get('id')
+        self.__requester = socket
         try:
-            jsonschema.validate(jmsg, IRC.Schema.DEFN)
-        except jsonschema.exceptions.ValidationError:
-            self.receivedInvalid(socket, msg)
-            return
+            if 'cmd' in jmsg:
+                self.__handlers['cmd'][jmsg['cmd']](socket, jmsg)
+            elif 'reply' in jmsg:
+                self.__handlers['reply'][jmsg['reply']](socket, jmsg)
+            elif 'error' in jmsg:
+                self.__handlers['error']['error'](socket, jmsg)
+            else:
+                raise BaseException("Unhandled Message Type")
+        finally:
+            self.__requestId = None
+            self.__requester = None
 
-        if 'cmd' in jmsg:
-            self.__handlers['cmd'][jmsg['cmd']](socket, jmsg)
-        elif 'reply' in jmsg:
-            self.__handlers['reply'][jmsg['reply']](socket, jmsg)
-        elif 'error' in jmsg:
-            self.__handlers['error']['error'](socket, jmsg)
-        else:
-            raise BaseException("Unhandled Message Type")
+    def getRequestId(self):
+        """ Get the request id of the message being handled (or None)
+
+        Replies and errors to a command echo its id, so a client can
+        have several requests in flight and match their replies.
+        """
+        return self.__requestId
+
+    def getRequester(self):
+        """ Get the socket buffer of the message being handled (or None)"""
+        return self.__requester
 
     def receiveMsg(self, socket):
         """ Receives data from socket and handles all
         available messages"""
         socket.recv()
+        return self.processMsgs(socket)
+
+    def processMsgs(self, socket):
+        """ Handle the messages buffered on a socket
+
+        If the socket's TokenBucket runs out, the remaining messages
+        stay buffered and the socket is throttled until it refills.
+        If the budget runs out, the socket waits in the backlog for
+        its next turn.
+        """
         processed = False
+        bucket = socket.getBucket()
+        budget = self.__budget
         while socket.hasMsg():
+            if budget == 0 and not socket.isDead():
+                self.__backlog[socket] = True
+                return processed
+            if bucket != None and not socket.isDead() and not bucket.take():
+                self.__throttled[socket] = time.time() + bucket.delay()
+                return processed
+            if budget != None:
+                budget -= 1
             msg = socket.getMsg()
             if msg == None:
                 return  # Incomplete buffer msg
             elif msg == '':
+                if self.__recorder != None:
+                    self.__recorder.recordClose(socket)
                 self.connectionDrop(socket)
                 return
             else:
+                if self.__recorder != None:
+                    self.__recorder.recordFrame(socket, msg)
                 self.processIRCMsg(socket, msg)
                 processed = True
+                if socket.isClosed():
+                    return processed  # Ended by the message, e.g. a quit
         return processed
 
     def stop(self):
@@ -390,7 +827,7 @@ class IRCHandler(object):
         pass
 
     @abstractmethod
-    def receivedJoin(self, socket, src, channels):
+    def receivedJoin(self, socket, src, channels, since):
         """ Notify received Join """
         pass
 
@@ -405,7 +842,7 @@ class IRCHandler(object):
         pass
 
     @abstractmethod
-    def receivedUsers(self, socket, channels, client_req):
+    def receivedUsers(self, socket, channels, client_req, since):
         """ Notify received Users """
         pass
 
@@ -425,10 +862,25 @@ class IRCHandler(object):
         pass
 
     @abstractmethod
-    def receivedNames(self, socket, channel, names, client):
+    def receivedSession(self, socket, token):
+        """ Notify received Session"""
+        pass
+
+    @abstractmethod
+    def receivedResume(self, socket, src, token):
+        """ Notify received Resume"""
+        pass
+
+    @abstractmethod
+    def receivedNames(self, socket, channel, names, client, version):
         """ Notify received Names"""
         pass
 
+    @abstractmethod
+    def receivedDelta(self, socket, channel, version, added, removed, client):
+        """ Notify received membership delta"""
+        pass
+
     @abstractmethod
     def receivedChannelsReply(self, socket, channels):
         """ Notify received channels reply"""
@@ -440,8 +892,12 @@ class IRCHandler(object):
         pass
 
     @abstractmethod
-    def receivedInvalid(self, socket, msg):
-        """ Notify received invalid message"""
+    def receivedInvalid(self, socket, msg, error):
+        """ Notify received invalid message and why it is invalid"""
+        pass
+
+    def overloadChanged(self, overloaded):
+        """ The run loop became overloaded or recovered"""
         pass
 
     @abstractmethod
@@ -0,0 +1,130 @@
+"""
+The IRC.Handoff passes live sockets and a state snapshot from a
+running process to its replacement over a unix socket. The sockets
+are sent as SCM_RIGHTS file descriptors, so connections stay open
+while the process serving them is replaced.
+"""
+import cPickle
+import logging
+import os
+import socket as sockmod
+import struct
+from multiprocessing.reduction import send_handle, recv_handle
+
+#Seconds to wait for the replacement process to take over
+HANDOFF_TIMEOUT = 30
+#Version of the snapshot and socket layout, a process only takes over
+#from one sending a format it knows
+HANDOFF_FORMAT = 1
+LENGTH = struct.Struct('!I')
+
+
+def recvExactly(conn, size):
+    """ Read exactly size bytes from a socket"""
+    data = ""
+    while len(data) < size:
+        chunk = conn.recv(size - len(data))
+        if chunk == '':
+            raise sockmod.error("Handoff connection closed")
+        data += chunk
+    return data
+
+
+def removeStale(path):
+    """ Remove what is left at the unix socket path, if anything"""
+    if os.path.lexists(path):
+        os.unlink(path)
+
+
+def sendHandoff(path, snapshot, sockets, spawn):
+    """ Hand a snapshot and sockets to a new process
+
+    Listens on the unix socket path and calls spawn to start the
+    replacement, which is expected to call receiveHandoff on the same
+    path. Returns True once the replacement acknowledged taking over,
+    otherwise the sockets are still ours to serve.
+    """
+    listener = sockmod.socket(sockmod.AF_UNIX, sockmod.SOCK_STREAM)
+    try:
+        removeStale(path)
+        listener.bind(path)
+        listener.listen(1)
+        listener.settimeout(HANDOFF_TIMEOUT)
+        spawn()
+        conn, address = listener.accept()
+        #Descriptors are passed on the raw fd, which must block
+        conn.settimeout(None)
+
+        payload = cPickle.dumps(
+            dict(snapshot, format=HANDOFF_FORMAT), cPickle.HIGHEST_PROTOCOL
+        )
+        conn.sendall(LENGTH.pack(len(payload)) + payload)
+        conn.sendall(LENGTH.pack(len(sockets)))
+        for s in sockets:
+            conn.sendall(LENGTH.pack(s.family))
+            send_handle(conn, s.fileno(), None)
+
+        conn.settimeout(HANDOFF_TIMEOUT)
+        ack = recvExactly(conn, 1)
+        conn.close()
+        if ack != 'k':
+            logging.critical("Handoff refused by the new process")
+        return ack == 'k'
+    except EnvironmentError as e:
+        #socket.error, or an OSError from the path or starting the process
+        logging.critical("Handoff failed: {e}".format(e=e))
+        return False
+    finally:
+        listener.close()
+        try:
+            removeStale(path)
+        except OSError as e:
+            logging.warning("Unable to remove {p}: {e}".format(p=path, e=e))
+
+
+def receiveHandoff(path, restore):
+    """ Take over the snapshot and sockets from a previous process
+
+    restore is called with the snapshot and the list of sockets in the
+    order they were sent, and returns if it took them over. Only then
+    does the previous process let go of them, if restore fails or the
+    format is unknown it keeps serving them. Returns if taken over.
+    """
+    conn = sockmod.socket(sockmod.AF_UNIX, sockmod.SOCK_STREAM)
+    conn.settimeout(HANDOFF_TIMEOUT)
+    conn.connect(path)
+    conn.settimeout(None)
+    try:
+        (size, ) = LENGTH.unpack(recvExactly(conn, LENGTH.size))
+        snapshot = cPickle.loads(recvExactly(conn, size))
+        #Builds before the format was versioned send none
+        version = snapshot.get('format')
+        if version not in (None, HANDOFF_FORMAT):
+            logging.critical(
+                "Refusing handoff format {v}, expected {f}".format(
+                    v=version, f=HANDOFF_FORMAT
+                )
+            )
+            conn.sendall('n')
+            return False
+
+        #Builds from before the unix listener send no address families,
+        #their snapshot has no 'unix' entry and every socket is TCP
+        families = version != None or 'unix' in snapshot
+        family = sockmod.AF_INET
+        (count, ) = LENGTH.unpack(recvExactly(conn, LENGTH.size))
+        sockets = []
+        for i in xrange(count):
+            if families:
+                (family, ) = LENGTH.unpack(recvExactly(conn, LENGTH.size))
+            fd = recv_handle(conn)
+            sockets.append(sockmod.fromfd(fd, family, sockmod.SOCK_STREAM))
+            os.close(fd)
+
+        if not restore(snapshot, sockets):
+            conn.sendall('n')
+            return False
+        conn.sendall('k')
+        return True
+    finally:
+        conn.close()
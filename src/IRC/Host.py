@@ -0,0 +1,137 @@
+"""
+The IRC.Host runs many IRCHandler sessions (for instance a fleet
+of bots) on a single select loop instead of one process and one
+loop per session. Each session keeps its own sockets and state,
+the host only multiplexes them and owns a shared set of timers.
+A server and clients linked to it by IRC.Loopback sockets can all
+be run on one host, without a port or the kernel in between.
+"""
+import heapq
+import itertools
+import logging
+import select
+import signal
+import time
+from IRC.Handler import selectable, waitReady
+
+
+class SessionHost(object):
+    """ Multiplexes the sockets of many handlers on one select loop
+
+    Each session's timeStep is scheduled on the shared timers at the
+    session's own timeout instead of being polled every wakeup.
+    """
+
+    def __init__(self):
+        """ Initialize an empty host"""
+        self.__sessions = []
+        self.__timers = []
+        self.__seq = itertools.count()
+        self.__running = True
+
+    def callLater(self, delay, fn):
+        """ Schedule fn to be called after delay seconds"""
+        heapq.heappush(
+            self.__timers, (time.time() + delay, next(self.__seq), fn)
+        )
+
+    def addSession(self, session):
+        """ Add an already connected session to the host"""
+        self.__sessions.append(session)
+        session.startup()
+        self.__scheduleStep(session)
+
+    def getSessions(self):
+        """ Return the sessions still being run"""
+        return self.__sessions
+
+    def __scheduleStep(self, session):
+        """ Schedule the next timeStep of a session"""
+
+        def step():
+            if session.isRunning():
+                session.timeStep()
+                self.__scheduleStep(session)
+
+        self.callLater(session.getTimeout(), step)
+
+    def __runTimers(self):
+        """ Run all timers that are due"""
+        now = time.time()
+        while len(self.__timers) and self.__timers[0][0] <= now:
+            (when, seq, fn) = heapq.heappop(self.__timers)
+            fn()
+
+    def __nextTimeout(self):
+        """ Time until the next timer or pending socket is due"""
+        timeout = None
+        if len(self.__timers):
+            timeout = max(0, self.__timers[0][0] - time.time())
+        for session in self.__sessions:
+            timeout = session.pendingTimeout(timeout)
+        return timeout
+
+    def __reap(self):
+        """ Shutdown and remove sessions that have stopped"""
+        for session in [s for s in self.__sessions if not s.isRunning()]:
+            self.__sessions.remove(session)
+            session.shutdown()
+
+    def stop(self):
+        """ Stop every session and the host"""
+        self.__running = False
+        for session in self.__sessions:
+            session.stop()
+
+    def receivedSignal(self, sig, frame):
+        """ Pass the signal on to every session"""
+        for session in self.__sessions:
+            session.receivedSignal(sig, frame)
+
+    def run(self):
+        """ Run all sessions until every one of them has stopped"""
+        logging.info("Host running {n} sessions".format(
+            n=len(self.__sessions)))
+        signal.signal(signal.SIGINT, self.receivedSignal)
+        try:
+            while self.__running and len(self.__sessions):
+                owners = {}
+                inputs = []
+                outputs = []
+                for session in self.__sessions:
+                    for s in session.getInputSocketList():
+                        if session.isPending(s):
+                            continue
+                        owners[selectable(s)] = (session, s)
+                        inputs.append(selectable(s))
+                    for s in session.getOutputSocketList():
+                        owners[selectable(s)] = (session, s)
+                        outputs.append(selectable(s))
+
+                inputready, outputready = waitReady(
+                    inputs, outputs, self.__nextTimeout()
+                )
+
+                ready = {}
+                for s in inputready:
+                    (session, sb) = owners[s]
+                    ready.setdefault(session, ([], []))[0].append(sb)
+                for s in outputready:
+                    (session, sb) = owners[s]
+                    ready.setdefault(session, ([], []))[1].append(sb)
+
+                for (session, (sessionIn, sessionOut)) in ready.items():
+                    session.dispatch(sessionIn, sessionOut, [])
+                for session in self.__sessions:
+                    session.runPending()
+
+                self.__runTimers()
+                self.__reap()
+        except select.error as e:
+            if e[0] == 4:  #interrupted system call
+                pass
+            else:
+                raise e
+        finally:
+            self.stop()
+            self.__reap()
@@ -0,0 +1,436 @@
+"""
+IRC.Ingest
+
+Moves the reading side of client connections into worker processes.
+Framing, decoding and validating the received frames takes most of
+the CPU time per message, so an IngestPool hands each client socket
+to a worker, which reads, frames, decodes and validates its messages
+and passes them to the server in batches over a unix socket. The
+server keeps writing to the sockets itself, and only applies the
+commands and fans out the replies.
+"""
+import errno
+import itertools
+import logging
+import marshal
+import multiprocessing
+import os
+import select
+import signal
+import socket as sockmod
+import struct
+import time
+from collections import deque, OrderedDict
+from multiprocessing.reduction import send_handle, recv_handle
+from IRC.Handler import SocketBuffer, waitReady
+from IRC.Handoff import recvExactly, LENGTH
+
+#Control messages from the server: kind and connection id
+CONTROL = struct.Struct('!cI')
+#Added connections: socket family and length of unframed data
+ADD_HEADER = struct.Struct('!II')
+ADD = 'A'
+PAUSE = 'P'
+RESUME = 'R'
+#Frames queued for a connection before its worker stops reading it
+QUEUE_HIGH = 256
+#Frames queued for a paused connection when its worker reads it again
+QUEUE_LOW = 64
+#Bytes of batches a worker writes to the server at a time
+BATCH_SEND = 65536
+#Seconds a worker waits for sockets before telling the server it is idle
+WORKER_TIMEOUT = 1.0
+
+
+def packBatch(readAt, batch, leftovers=None):
+    """ Pack the frames read by a worker for the server
+
+    readAt is when the worker started reading the frames. batch lists
+    (connection id, frame, decoding) tuples, the decoding being the
+    (message, error) SocketBuffer.decode returned, and a frame of ''
+    with no decoding when the connection dropped. leftovers maps
+    connection ids to the data not yet framed when the worker stops.
+    marshal is used as it is much faster than pickle for the plain
+    data in messages.
+    """
+    payload = marshal.dumps((readAt, batch, leftovers))
+    return LENGTH.pack(len(payload)) + payload
+
+
+def ingestWorker(channel, inherited):
+    """ Run an ingest worker on the channel to the server
+
+    Reads the connections the server adds until the server closes
+    the channel, then sends the data not yet framed and exits. The
+    server's ends of the channels are inherited, and closed so that
+    only the server holds them.
+    """
+    #Signals are meant for the server, which stops the workers itself
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGUSR1, signal.SIG_IGN)
+    signal.signal(signal.SIGUSR2, signal.SIG_IGN)
+    for s in inherited:
+        s.close()
+    #Packed batches the server has not taken yet
+    pending = ''
+    #fileno -> (connection id, SocketBuffer)
+    conns = {}
+    paused = set()
+
+    def readFrames(cid, sb, batch):
+        while sb.hasMsg():
+            frame = sb.getMsg()
+            if frame == None:
+                return
+            elif frame == '':
+                batch.append((cid, '', None))
+                del conns[sb.getSocket().fileno()]
+                paused.discard(cid)
+                sb.getSocket().close()
+                return
+            batch.append((cid, frame, sb.decode(frame)))
+
+    while True:
+        inputs = [channel]
+        if not len(pending):
+            #Only read more once the server took the last batch
+            inputs.extend(
+                sb.getSocket() for (cid, sb) in conns.values()
+                if cid not in paused
+            )
+        outputs = [channel] if len(pending) else []
+        try:
+            inputready, outputready = waitReady(
+                inputs, outputs, WORKER_TIMEOUT
+            )
+        except select.error as e:
+            if e[0] == errno.EINTR:
+                continue
+            raise e
+        readAt = time.time()
+        if len(outputready):
+            #Without blocking, so control messages are always read
+            try:
+                pending = pending[
+                    channel.send(pending[:BATCH_SEND], sockmod.MSG_DONTWAIT):
+                ]
+            except sockmod.error as e:
+                if e[0] != errno.EAGAIN:
+                    return
+
+        batch = []
+        for s in inputready:
+            if s is not channel:
+                (cid, sb) = conns[s.fileno()]
+                sb.recv()
+                readFrames(cid, sb, batch)
+                continue
+
+            #All queued control messages, so new clients are read soon
+            while True:
+                header = channel.recv(CONTROL.size)
+                if header == '':
+                    leftovers = dict(
+                        (cid, sb.snapshot()['recv'])
+                        for (cid, sb) in conns.values()
+                    )
+                    try:
+                        channel.sendall(
+                            pending + packBatch(readAt, batch, leftovers)
+                        )
+                    except sockmod.error:
+                        pass  # The server exited instead of handing off
+                    return
+                header += recvExactly(channel, CONTROL.size - len(header))
+                (kind, cid) = CONTROL.unpack(header)
+                if kind == ADD:
+                    (family, size) = ADD_HEADER.unpack(
+                        recvExactly(channel, ADD_HEADER.size)
+                    )
+                    unframed = recvExactly(channel, size) if size else ''
+                    fd = recv_handle(channel)
+                    sb = SocketBuffer(
+                        sockmod.fromfd(fd, family, sockmod.SOCK_STREAM)
+                    )
+                    os.close(fd)
+                    sb.restore({'send': '', 'recv': unframed})
+                    conns[sb.getSocket().fileno()] = (cid, sb)
+                    readFrames(cid, sb, batch)
+                elif kind == PAUSE:
+                    paused.add(cid)
+                elif kind == RESUME:
+                    paused.discard(cid)
+                if not len(waitReady([channel], [], 0)[0]):
+                    break
+
+        idle = not (len(inputready) or len(outputready) or len(pending))
+        if len(batch) or idle:
+            #Even empty when idle, so the server knows it has caught up
+            pending += packBatch(readAt, batch)
+
+
+class IngestSocketBuffer(SocketBuffer):
+    """ A client socket buffer whose frames are read by an ingest worker
+
+    The server still sends on the socket, received frames arrive
+    already decoded from the worker instead of through recv.
+    """
+    __slots__ = (
+        '__frames', '__decoded', '__dropped', '__notified', '__pool',
+        '__connId', '__paused', '__unframed', '__receivedAt'
+    )
+
+    def __init__(self, socket, misc=None):
+        """ Initialize an ingest socket buffer"""
+        super(IngestSocketBuffer, self).__init__(socket, misc)
+        self.__frames = deque()
+        self.__decoded = None
+        self.__dropped = False
+        self.__notified = False
+        self.__pool = None
+        self.__connId = None
+        self.__paused = False
+        self.__unframed = ''
+        self.__receivedAt = None
+
+    def attach(self, pool, connId):
+        """ Associate the buffer with its IngestPool connection"""
+        self.__pool = pool
+        self.__connId = connId
+
+    def getConnId(self):
+        """ Get the IngestPool connection id"""
+        return self.__connId
+
+    def takeUnframed(self):
+        """ Take the received data that still needs framing"""
+        (unframed, self.__unframed) = (self.__unframed, '')
+        return unframed
+
+    def setUnframed(self, unframed):
+        """ Keep received data the worker did not frame"""
+        self.__unframed = unframed
+
+    def pushFrame(self, frame, decoded, readAt):
+        """ Queue a frame and its decoding from the worker
+
+        readAt is when the worker started reading the frame's batch.
+        """
+        self.__frames.append((frame, decoded, readAt))
+        if not self.__paused and len(self.__frames) > QUEUE_HIGH:
+            self.__paused = True
+            self.__pool.pause(self)
+
+    def dropped(self):
+        """ The worker found the connection closed for reading
+
+        Replies can still be sent until the server closes it.
+        """
+        self.__dropped = True
+
+    def hasMsg(self):
+        """ Determine if a message is queued (including disconnect)"""
+        return len(self.__frames) > 0 or (
+            (self.__dropped or self.isDead()) and not self.__notified
+        )
+
+    def getMsg(self):
+        """ Return the next queued message (including disconnect)"""
+        if len(self.__frames):
+            (frame, self.__decoded, self.__receivedAt) = (
+                self.__frames.popleft()
+            )
+            if self.__paused and len(self.__frames) < QUEUE_LOW:
+                self.__paused = False
+                self.__pool.resume(self)
+            return frame
+        elif (self.__dropped or self.isDead()) and not self.__notified:
+            self.__notified = True
+            return ''
+        return None
+
+    def decode(self, msg):
+        """ The worker's decoding of the message getMsg returned"""
+        return self.__decoded
+
+    def receivedAt(self):
+        """ When the worker read the message getMsg returned"""
+        return self.__receivedAt
+
+    def close(self):
+        """ Close the socket, ending the worker's reads of it too"""
+        if not self.isDead():
+            while self.readyToSend():
+                self.send()
+        try:
+            self.getSocket().shutdown(sockmod.SHUT_RDWR)
+        except sockmod.error:
+            pass
+        super(IngestSocketBuffer, self).close()
+        self.__frames.clear()
+
+    def snapshot(self):
+        """ Return the unprocessed buffer contents"""
+        snapshot = super(IngestSocketBuffer, self).snapshot()
+        snapshot['recv'] = ''.join(
+            f + "\r\n" for (f, j, r) in self.__frames
+        ) + self.__unframed
+        return snapshot
+
+    def restore(self, snapshot):
+        """ Restore buffer contents taken from another SocketBuffer
+
+        The received data is framed by the worker once attached.
+        """
+        super(IngestSocketBuffer, self).restore(dict(snapshot, recv=''))
+        self.__unframed = snapshot['recv']
+
+
+class IngestPool(object):
+    """ Ingest worker processes and the connections they read"""
+
+    def __init__(self, workers):
+        """ Start the worker processes"""
+        self.__channels = []
+        self.__processes = []
+        for i in xrange(workers):
+            (channel, worker) = sockmod.socketpair()
+            #Batches queue in the worker, where clients are not read,
+            #instead of in the kernel ahead of the server
+            worker.setsockopt(sockmod.SOL_SOCKET, sockmod.SO_SNDBUF, BATCH_SEND)
+            p = multiprocessing.Process(
+                target=ingestWorker,
+                args=(worker, self.__channels + [channel]),
+                name="ingest-{i}".format(i=i)
+            )
+            p.daemon = True
+            p.start()
+            worker.close()
+            self.__channels.append(channel)
+            self.__processes.append(p)
+        #Channel -> bytes received of a partial batch
+        self.__received = dict((c, '') for c in self.__channels)
+        #Channel -> when the worker read its last batch
+        self.__readAt = dict((c, 0) for c in self.__channels)
+        #Connection id -> (IngestSocketBuffer, channel)
+        self.__conns = {}
+        self.__ids = itertools.count()
+        self.__turn = itertools.cycle(self.__channels)
+        self.__stopping = False
+
+    def getSockets(self):
+        """ Get the channels to wait on for batches from the workers"""
+        return self.__received.keys()
+
+    def owns(self, channel):
+        """ Is this a channel to a worker?"""
+        return channel in self.__received
+
+    def __control(self, channel, msg):
+        """ Send a control message to a worker"""
+        try:
+            channel.sendall(msg)
+        except sockmod.error as e:
+            logging.warning("Ingest worker unreachable: {e}".format(e=e))
+
+    def add(self, sb):
+        """ Hand a client's IngestSocketBuffer to the next worker"""
+        cid = next(self.__ids)
+        channel = next(self.__turn)
+        sb.attach(self, cid)
+        self.__conns[cid] = (sb, channel)
+        s = sb.getSocket()
+        unframed = sb.takeUnframed()
+        self.__control(
+            channel,
+            CONTROL.pack(ADD, cid) + ADD_HEADER.pack(s.family, len(unframed)) +
+            unframed
+        )
+        send_handle(channel, s.fileno(), None)
+
+    def pause(self, sb):
+        """ Stop reading a connection with many queued frames"""
+        (s, channel) = self.__conns[sb.getConnId()]
+        self.__control(channel, CONTROL.pack(PAUSE, sb.getConnId()))
+
+    def resume(self, sb):
+        """ Read a paused connection again"""
+        if sb.getConnId() in self.__conns:
+            (s, channel) = self.__conns[sb.getConnId()]
+            self.__control(channel, CONTROL.pack(RESUME, sb.getConnId()))
+
+    def caughtUp(self, sb, since):
+        """ Have the frames the worker read since a time been queued?
+
+        Until then, a reply from the client such as a pong may still
+        be on its way from the worker.
+        """
+        entry = self.__conns.get(sb.getConnId())
+        return entry == None or self.__readAt[entry[1]] > since
+
+    def receive(self, channel):
+        """ Queue the frames of complete batches from a worker
+
+        Returns the buffers that received frames or dropped, in the
+        order they were read.
+        """
+        data = channel.recv(65536)
+        if data == '':
+            del self.__received[channel]
+            if self.__stopping:
+                return []
+            logging.critical("Ingest worker exited")
+            data = packBatch(time.time(), [
+                (cid, '', None) for (cid, (sb, c)) in self.__conns.items()
+                if c is channel
+            ])
+        else:
+            data = self.__received[channel] + data
+
+        touched = OrderedDict()
+        while len(data) >= LENGTH.size:
+            (size, ) = LENGTH.unpack(data[:LENGTH.size])
+            if len(data) < LENGTH.size + size:
+                break
+            (readAt, batch, leftovers) = marshal.loads(
+                data[LENGTH.size:LENGTH.size + size]
+            )
+            data = data[LENGTH.size + size:]
+            self.__readAt[channel] = readAt
+            for (cid, frame, decoded) in batch:
+                if cid not in self.__conns:
+                    continue
+                (sb, c) = self.__conns[cid]
+                if frame == '':
+                    del self.__conns[cid]
+                    sb.dropped()
+                else:
+                    sb.pushFrame(frame, decoded, readAt)
+                if not sb.isClosed():
+                    touched[sb] = True
+            for (cid, unframed) in (leftovers or {}).items():
+                if cid in self.__conns:
+                    self.__conns[cid][0].setUnframed(unframed)
+        if channel in self.__received:
+            self.__received[channel] = data
+        return touched.keys()
+
+    def stop(self):
+        """ Stop the workers, queueing everything they have read
+
+        Data the workers received but did not frame is kept in the
+        buffers, so their snapshots are complete for a handoff.
+        """
+        touched = []
+        self.__stopping = True
+        for channel in self.__received.keys():
+            try:
+                channel.shutdown(sockmod.SHUT_WR)
+            except sockmod.error:
+                pass
+        while len(self.__received):
+            for channel in self.__received.keys():
+                touched.extend(self.receive(channel))
+        for p in self.__processes:
+            p.join()
+        return touched
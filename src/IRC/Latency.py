@@ -0,0 +1,246 @@
+"""
+IRC.Latency
+
+Histograms of the latencies a server sees, such as the round trip
+times of its pings, the tracing of frames through socket buffers
+that tells how long a frame was queued before it was sent, and the
+monitoring of an event loop's own lag.
+"""
+from collections import deque
+import math
+import time
+
+#Histogram buckets per doubling of the latency
+BUCKETS_PER_OCTAVE = 8
+#Latencies below this many seconds all fall into the first bucket
+RESOLUTION = 1e-6
+#Seconds of iterations the loop lag is averaged over
+LAG_WINDOW = 1.0
+#Seconds a loop stays overloaded after it last went over a limit
+OVERLOAD_HOLD = 2.0
+
+
+def bucketOf(seconds):
+    """ The histogram bucket of a latency"""
+    if seconds <= RESOLUTION:
+        return 0
+    return int(math.log(seconds / RESOLUTION, 2) * BUCKETS_PER_OCTAVE) + 1
+
+
+def bucketLimit(bucket):
+    """ The largest latency in seconds that falls into a bucket"""
+    return RESOLUTION * 2 ** (float(bucket) / BUCKETS_PER_OCTAVE)
+
+
+class Histogram(object):
+    """ A histogram of latencies in seconds
+
+    Buckets grow exponentially, so whatever the range of latencies
+    percentiles are accurate to within a bucket, about 9%. Only the
+    buckets used are stored.
+    """
+    __slots__ = ('__counts', '__count', '__total', '__max')
+
+    def __init__(self):
+        """ Initialize an empty histogram"""
+        self.__counts = {}
+        self.__count = 0
+        self.__total = 0.0
+        self.__max = 0.0
+
+    def add(self, seconds):
+        """ Count a latency"""
+        seconds = max(0.0, seconds)
+        b = bucketOf(seconds)
+        self.__counts[b] = self.__counts.get(b, 0) + 1
+        self.__count += 1
+        self.__total += seconds
+        self.__max = max(self.__max, seconds)
+
+    def count(self):
+        """ Number of latencies counted"""
+        return self.__count
+
+    def mean(self):
+        """ The mean latency (or None if empty)"""
+        if self.__count == 0:
+            return None
+        return self.__total / self.__count
+
+    def max(self):
+        """ The largest latency (or None if empty)"""
+        if self.__count == 0:
+            return None
+        return self.__max
+
+    def percentile(self, p):
+        """ The latency p percent of the counted ones are below (or None)"""
+        if self.__count == 0:
+            return None
+        rank = self.__count * p / 100.0
+        seen = 0
+        for b in sorted(self.__counts):
+            seen += self.__counts[b]
+            if seen >= rank:
+                return min(bucketLimit(b), self.__max)
+        return self.__max
+
+    def summary(self):
+        """ Describe the histogram in one line, in milliseconds"""
+        if self.__count == 0:
+            return "n=0"
+        return "n={n} mean={mean:.3f}ms p50={p50:.3f}ms p90={p90:.3f}ms " \
+            "p99={p99:.3f}ms max={max:.3f}ms".format(
+                n=self.__count,
+                mean=self.mean() * 1000,
+                p50=self.percentile(50) * 1000,
+                p90=self.percentile(90) * 1000,
+                p99=self.percentile(99) * 1000,
+                max=self.__max * 1000
+            )
+
+    def snapshot(self):
+        """ Serializable state needed to restore the histogram elsewhere"""
+        return {
+            'counts': dict(self.__counts),
+            'count': self.__count,
+            'total': self.__total,
+            'max': self.__max
+        }
+
+    def restore(self, snapshot):
+        """ Restore the counts from a snapshot"""
+        self.__counts = dict(snapshot['counts'])
+        self.__count = snapshot['count']
+        self.__total = snapshot['total']
+        self.__max = snapshot['max']
+
+
+class FrameTrace(object):
+    """ Follows the frames through one socket buffer
+
+    Remembers when data was last received, and how long each frame
+    queued to send waited until it was flushed to the socket, which
+    is counted in a Histogram shared by the traced buffers.
+    """
+    __slots__ = ('__queueing', '__receivedAt', '__queued', '__sent', '__marks')
+
+    def __init__(self, queueing):
+        """ Initialize a trace counting queueing delays in a Histogram"""
+        self.__queueing = queueing
+        self.__receivedAt = None
+        self.__queued = 0
+        self.__sent = 0
+        #(bytes queued up to the end of a frame, when it was queued)
+        self.__marks = deque()
+
+    def received(self):
+        """ Data was received"""
+        self.__receivedAt = time.time()
+
+    def receivedAt(self):
+        """ When data was last received (or None)"""
+        return self.__receivedAt
+
+    def queued(self, length, when=None):
+        """ A frame of length bytes was queued to send, by default now
+
+        Frames are traced in the order they are sent.
+        """
+        self.__queued += length
+        self.__marks.append(
+            (self.__queued, when if when != None else time.time())
+        )
+
+    def sent(self, length):
+        """ Length bytes were flushed to the socket"""
+        self.__sent += length
+        now = time.time()
+        while len(self.__marks) and self.__marks[0][0] <= self.__sent:
+            (end, when) = self.__marks.popleft()
+            self.__queueing.add(now - when)
+
+    def skipped(self, length):
+        """ Length bytes queued were taken away instead of sent"""
+        self.__sent += length
+        while len(self.__marks) and self.__marks[0][0] <= self.__sent:
+            self.__marks.popleft()
+
+
+class LoopMonitor(object):
+    """ Measures the lag and iteration time of an event loop
+
+    The lag is how long an event becoming ready waits for the loop to
+    get back to it: the length of the iteration under way, or nothing
+    while the loop waits, averaged over about LAG_WINDOW seconds. The
+    loop is overloaded when the lag or a single iteration goes over its
+    limit, and stays so until it has been back under both for
+    OVERLOAD_HOLD seconds. A limit of 0 is never reached.
+    """
+    __slots__ = (
+        '__lagLimit', '__iterationLimit', '__lag', '__last', '__iterations',
+        '__triggered', '__overloaded'
+    )
+
+    def __init__(self, lagLimit, iterationLimit):
+        """ Initialize a monitor with limits in seconds"""
+        self.__lagLimit = lagLimit
+        self.__iterationLimit = iterationLimit
+        self.__lag = 0.0
+        #When the last iteration ended (or None)
+        self.__last = None
+        self.__iterations = Histogram()
+        #When the loop last went over a limit (or None)
+        self.__triggered = None
+        self.__overloaded = False
+
+    def iteration(self, busy, done):
+        """ Count an iteration that worked busy seconds, done by then
+
+        Returns if the overload state changed.
+        """
+        busy = max(0.0, busy)
+        if self.__last != None:
+            #No event waits on the loop while it waits on events
+            waited = max(0.0, done - self.__last - busy)
+            self.__lag *= math.exp(-waited / LAG_WINDOW)
+        #While it works, events wait up to as long as the iteration takes
+        self.__lag += (1 - math.exp(-busy / LAG_WINDOW)) * (busy - self.__lag)
+        self.__last = done
+        self.__iterations.add(busy)
+
+        if (0 < self.__lagLimit < self.__lag or
+                0 < self.__iterationLimit < busy):
+            self.__triggered = done
+        overloaded = self.__triggered != None and \
+            done - self.__triggered < OVERLOAD_HOLD
+        changed = overloaded != self.__overloaded
+        self.__overloaded = overloaded
+        return changed
+
+    def lag(self):
+        """ The loop lag in seconds"""
+        return self.__lag
+
+    def getIterations(self):
+        """ The Histogram of iteration times"""
+        return self.__iterations
+
+    def isOverloaded(self):
+        """ Is the loop overloaded?"""
+        return self.__overloaded
+
+    def wasOverloaded(self, since):
+        """ Was the loop overloaded at any time since then?"""
+        return self.__overloaded or (
+            self.__triggered != None and
+            self.__triggered + OVERLOAD_HOLD > since
+        )
+
+    def summary(self):
+        """ Describe the loop's state in one line, in milliseconds"""
+        return "lag={lag:.3f}ms overloaded={o} iterations: {h}".format(
+            lag=self.__lag * 1000,
+            o="yes" if self.__overloaded else "no",
+            h=self.__iterations.summary()
+        )
@@ -0,0 +1,83 @@
+"""
+IRC.Loopback
+
+An in-memory transport that links an IRCClient to an IRCServer in the
+same process. Each end is a socket-like LoopbackSocket wrapped in an
+ordinary SocketBuffer, so handlers use it like any other connection,
+but sending and receiving only move strings from one end to the other
+without a single syscall. Both ends must be run by the same loop, such
+as an IRC.Host.SessionHost, since nothing wakes a loop waiting on the
+kernel when the other end sends.
+"""
+from collections import deque
+import errno
+import socket as sockmod
+
+
+class LoopbackSocket(object):
+    """ One end of an in-memory connection
+
+    Implements the part of the non-blocking socket interface a
+    SocketBuffer uses: send, recv and close.
+    """
+    __slots__ = ('__peer', '__inbox', '__closed', '__peerClosed')
+
+    def __init__(self, peer=None):
+        """ Initialize an end, connected to peer if given"""
+        self.__peer = None
+        #Strings sent by the peer and not received yet, oldest first
+        self.__inbox = deque()
+        self.__closed = False
+        self.__peerClosed = False
+        if peer != None:
+            self.__peer = peer
+            peer.__peer = self
+
+    def send(self, data):
+        """ Deliver data to the peer, returns the bytes sent"""
+        if self.__closed:
+            raise sockmod.error(errno.EBADF, "Bad file descriptor")
+        if self.__peer == None or self.__peerClosed:
+            raise sockmod.error(errno.EPIPE, "Broken pipe")
+        if len(data):
+            self.__peer.__inbox.append(data)
+        return len(data)
+
+    def recv(self, size):
+        """ Receive up to size bytes, '' once the peer closed"""
+        if self.__closed:
+            raise sockmod.error(errno.EBADF, "Bad file descriptor")
+        if len(self.__inbox) == 0:
+            if self.__peerClosed:
+                return ''
+            raise sockmod.error(errno.EAGAIN, "Resource unavailable")
+        chunks = []
+        while len(self.__inbox) and size > 0:
+            data = self.__inbox.popleft()
+            if len(data) > size:
+                self.__inbox.appendleft(data[size:])
+                data = data[:size]
+            chunks.append(data)
+            size -= len(data)
+        return "".join(chunks)
+
+    def readable(self):
+        """ Would recv return without failing?"""
+        return not self.__closed and (
+            len(self.__inbox) > 0 or self.__peerClosed
+        )
+
+    def close(self):
+        """ Close this end, the peer receives the end of the stream"""
+        if self.__closed:
+            return
+        self.__closed = True
+        self.__inbox.clear()
+        if self.__peer != None:
+            self.__peer.__peerClosed = True
+
+
+def loopbackPair():
+    """ Return the two ends of a new in-memory connection"""
+    a = LoopbackSocket()
+    return (a, LoopbackSocket(a))
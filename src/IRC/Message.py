@@ -1,3 +1,19 @@
+def internName(name):
+    """ Share one string object for every copy of a nick or channel name
+
+    Names are ASCII by the schema, so decoded unicode names can be
+    stored as interned byte strings.
+    """
+    return intern(str(name))
+
+
+def withId(msg, reqid):
+    """ Add the optional request id to a message"""
+    if reqid != None:
+        msg['id'] = reqid
+    return msg
+
+
 class IRCMessage(object):
     def __init__(self, src):
         """Initialize sender with source"""
@@ -19,9 +35,15 @@ class IRCMessage(object):
         """ Send a Squit command"""
         return {'cmd': 'squit', 'src': self.__src, 'msg': msg}
 
-    def cmdJoin(self, channels):
-        """ Send a Join command"""
-        return {'cmd': 'join', 'src': self.__src, 'channels': channels}
+    def cmdJoin(self, channels, reqid=None, since=None):
+        """ Send a Join command
+
+        since maps channels to the membership versions already known.
+        """
+        msg = {'cmd': 'join', 'src': self.__src, 'channels': channels}
+        if since:
+            msg['since'] = since
+        return withId(msg, reqid)
 
     def cmdLeave(self, channels, msg):
         """ Send a Leave command"""
@@ -32,16 +54,22 @@ class IRCMessage(object):
             'msg': msg
         }
 
-    def cmdChannels(self):
+    def cmdChannels(self, reqid=None):
         """ Send a Channels command"""
-        return {'cmd': 'channels', 'src': self.__src}
+        return withId({'cmd': 'channels', 'src': self.__src}, reqid)
+
+    def cmdUsers(self, channels, client, reqid=None, since=None):
+        """ Send a Users command
 
-    def cmdUsers(self, channels, client):
-        """ Send a Users command"""
-        return {'cmd': 'users',
-                'src': self.__src,
-                'channels': channels,
-                'client': client}
+        since maps channels to the membership versions already known.
+        """
+        msg = {'cmd': 'users',
+               'src': self.__src,
+               'channels': channels,
+               'client': client}
+        if since:
+            msg['since'] = since
+        return withId(msg, reqid)
 
     def cmdMsg(self, msg, targets):
         """ Send a Message command"""
@@ -55,17 +83,37 @@ class IRCMessage(object):
         """ Send a Pong command"""
         return {'cmd': 'pong', 'src': self.__src, 'msg': msg}
 
-    def errorMsg(self, etype, msg):
+    def cmdSession(self, token):
+        """ Send a Session command"""
+        return {'cmd': 'session', 'src': self.__src, 'token': token}
+
+    def cmdResume(self, token):
+        """ Send a Resume command"""
+        return {'cmd': 'resume', 'src': self.__src, 'token': token}
+
+    def errorMsg(self, etype, msg, reqid=None):
         """ Send a Error reply"""
-        return {'error': etype, 'msg': msg}
+        return withId({'error': etype, 'msg': msg}, reqid)
 
-    def replyChannels(self, channels):
+    def replyChannels(self, channels, reqid=None):
         """ Send a channels reply"""
-        return {'reply': 'channels', 'channels': channels}
+        return withId({'reply': 'channels', 'channels': channels}, reqid)
 
-    def replyNames(self, channel, names, client):
+    def replyNames(self, channel, names, client, reqid=None, version=None):
         """ Send a names reply"""
-        return {'reply': 'names',
-                'channel': channel,
-                'names': names,
-                'client': client}
+        msg = {'reply': 'names',
+               'channel': channel,
+               'names': names,
+               'client': client}
+        if version != None:
+            msg['version'] = version
+        return withId(msg, reqid)
+
+    def replyDelta(self, channel, version, added, removed, client, reqid=None):
+        """ Send a membership delta reply"""
+        return withId({'reply': 'delta',
+                       'channel': channel,
+                       'version': version,
+                       'added': added,
+                       'removed': removed,
+                       'client': client}, reqid)
@@ -0,0 +1,49 @@
+"""
+Rate limiting primitives used to keep a single connection or channel
+from monopolizing the event loop.
+"""
+import time
+
+
+class TokenBucket(object):
+    """ A token bucket
+
+    Tokens are added at rate per second up to burst, each unit of
+    work takes one token.
+    """
+    __slots__ = ('__rate', '__burst', '__tokens', '__last')
+
+    def __init__(self, rate, burst):
+        """ Initialize a full bucket """
+        self.__rate = float(rate)
+        self.__burst = burst
+        self.__tokens = float(burst)
+        self.__last = time.time()
+
+    def __refill(self):
+        """ Add the tokens earned since the last refill """
+        now = time.time()
+        self.__tokens = min(
+            self.__burst, self.__tokens + (now - self.__last) * self.__rate
+        )
+        self.__last = now
+
+    def take(self, count=1):
+        """ Take tokens if available, returns if they were taken """
+        if self.__tokens < count:
+            self.__refill()
+            if self.__tokens < count:
+                return False
+        self.__tokens -= count
+        return True
+
+    def allows(self, count=1):
+        """ Are count tokens available, without taking them """
+        if self.__tokens < count:
+            self.__refill()
+        return self.__tokens >= count
+
+    def delay(self, count=1):
+        """ Seconds until count tokens will be available """
+        self.__refill()
+        return max(0, (count - self.__tokens) / self.__rate)
@@ -1,13 +1,14 @@
 """
-The definitions provided here are intended to be parsed
-by the jsonschema module and used to validate the incoming/
-outgoing messages to the client/server for an IRC client.
+The definitions provided here are JSON schemas compiled by
+IRC.Validator and used to validate the incoming/outgoing
+messages to the client/server for an IRC client.
 
 For an overview, see the IRC RFC.
 """
 
 NICK = '[a-zA-Z0-9]{1,10}'
 CHANNEL = '#[a-zA-Z0-9]{1,10}'
+TOKEN = '[0-9a-f]{32}'
 
 DEFN = {
     'oneOf': [
@@ -21,6 +22,33 @@ DEFN = {
             {'$ref': '#/target/channel'},
         ]
     },
+    'reqid': {
+        'type': 'integer',
+        'minimum': 0
+    },
+    'version': {
+        'type': 'integer',
+        'minimum': 0
+    },
+    'since': {
+        'type': 'object',
+        'patternProperties': {
+            '^' + CHANNEL + '$': {'$ref': '#/version'}
+        },
+        'additionalProperties': False
+    },
+    'token': {
+        'type': 'string',
+        'pattern': '^' + TOKEN + '$'
+    },
+    'trace': {
+        'type': 'object',
+        'properties': {
+            'recv': {'type': 'number'},
+            'enq': {'type': 'number'}
+        },
+        'required': ['recv', 'enq']
+    },
     'target': {
         'user': {
             'type': 'string',
@@ -37,7 +65,8 @@ DEFN = {
             'cmd': {'type': 'string'},
             'src': {
                 'oneOf': [{'$ref': '#/targets'}]
-            }
+            },
+            'id': {'$ref': '#/reqid'}
         },
         'oneOf': [
             {'$ref': '#/cmds/nick'},
@@ -50,6 +79,8 @@ DEFN = {
             {'$ref': '#/cmds/msg'},
             {'$ref': '#/cmds/ping'},
             {'$ref': '#/cmds/pong'},
+            {'$ref': '#/cmds/session'},
+            {'$ref': '#/cmds/resume'},
         ],
         'required': ['cmd', 'src']
     },
@@ -90,6 +121,7 @@ DEFN = {
                     'minItems': 1,
                     'uniqueItems': True
                 },
+                'since': {'$ref': '#/since'}
             },
             'required': ['channels']
         },
@@ -127,7 +159,8 @@ DEFN = {
                     'minItems': 1,
                     'uniqueItems': True
                 },
-                'client': {'type': 'boolean'}
+                'client': {'type': 'boolean'},
+                'since': {'$ref': '#/since'}
             },
             'required': ['channels', 'client']
         },
@@ -143,7 +176,8 @@ DEFN = {
                     'minItems': 1,
                     'uniqueItems': True
                 },
-                'msg': {'type': 'string'}
+                'msg': {'type': 'string'},
+                'trace': {'$ref': '#/trace'}
             },
             'required': ['targets', 'msg']
         },
@@ -162,6 +196,22 @@ DEFN = {
                 'msg': {'type': 'string'}
             },
             'required': ['msg']
+        },
+        'session': {
+            'type': 'object',
+            'properties': {
+                'cmd': {'enum': ['session']},
+                'token': {'$ref': '#/token'}
+            },
+            'required': ['token']
+        },
+        'resume': {
+            'type': 'object',
+            'properties': {
+                'cmd': {'enum': ['resume']},
+                'token': {'$ref': '#/token'}
+            },
+            'required': ['token']
         }
     },
     'errors': {
@@ -171,12 +221,14 @@ DEFN = {
                 'error': {
                     'enum': [
                         'badnick', 'nickinuse', 'schema', 'nochannel',
-                        'badchannel', 'nonmember', 'member', 'nonexist'
+                        'badchannel', 'nonmember', 'member', 'nonexist',
+                        'flood', 'nosession'
                     ]
                 },
                 'msg': {
                     'type': 'string'
-                }
+                },
+                'id': {'$ref': '#/reqid'}
             },
             'required': ['error', 'msg']
         }
@@ -186,11 +238,13 @@ DEFN = {
         'properties': {
             'reply': {
                 'type': 'string',
-            }
+            },
+            'id': {'$ref': '#/reqid'}
         },
         'oneOf': [
             {'$ref': '#/replies/channels'},
             {'$ref': '#/replies/names'},
+            {'$ref': '#/replies/delta'},
         ],
         'required': ['reply']
     },
@@ -213,10 +267,42 @@ DEFN = {
                 },
                 'client': {
                     'type': 'boolean',
-                }
+                },
+                'version': {'$ref': '#/version'}
             },
             'required': ['reply', 'names', 'client']
         },
+        'delta': {
+            'type': 'object',
+            'properties': {
+                'reply': {'enum': ['delta']},
+                'channel': {
+                    'type': 'string',
+                    'oneOf': [{'$ref': '#/target/channel'}]
+                },
+                'version': {'$ref': '#/version'},
+                'added': {
+                    'type': 'array',
+                    'items': {
+                        'oneOf': [{'$ref': '#/target/user'}]
+                    },
+                    'uniqueItems': True
+                },
+                'removed': {
+                    'type': 'array',
+                    'items': {
+                        'oneOf': [{'$ref': '#/target/user'}]
+                    },
+                    'uniqueItems': True
+                },
+                'client': {
+                    'type': 'boolean',
+                }
+            },
+            'required': [
+                'reply', 'channel', 'version', 'added', 'removed', 'client'
+            ]
+        },
         'channels': {
             'type': 'object',
             'properties': {
@@ -0,0 +1,102 @@
+"""
+IRC.Trace
+
+Records the frames a handler receives to a compact binary trace, so
+production traffic can be replayed against a server later.
+
+A trace starts with MAGIC, followed by one record per event: the
+time, the connection id and the length of the frame, then the frame
+itself. A record with no frame marks the connection closing.
+"""
+import os
+import struct
+import time
+
+MAGIC = 'IRCTRACE\x01'
+RECORD = struct.Struct('!dIH')
+#Bytes buffered before writing to the trace file
+BUFFER_SIZE = 65536
+#Connections tracked before closed ones are pruned
+PRUNE_MIN = 64
+
+
+class TraceError(Exception):
+    """ The file is not a trace or is corrupt"""
+    pass
+
+
+def readTrace(path):
+    """ Yield the (time, connection id, frame) records of a trace
+
+    The frame is '' when the connection closed. A record cut short by
+    the recording process dying ends the trace.
+    """
+    with open(path, 'rb') as trace:
+        if trace.read(len(MAGIC)) != MAGIC:
+            raise TraceError("Not an IRC trace: {p}".format(p=path))
+        while True:
+            header = trace.read(RECORD.size)
+            if len(header) < RECORD.size:
+                return
+            (when, conn, length) = RECORD.unpack(header)
+            frame = trace.read(length)
+            if len(frame) < length:
+                return
+            yield (when, conn, frame)
+
+
+class TraceRecorder(object):
+    """ Writes the frames received on socket buffers to a trace
+
+    Each socket buffer gets the next connection id when its first
+    frame is recorded. Recording to an existing trace appends to it,
+    continuing after its connection ids, as a server does when taking
+    over from a handoff.
+    """
+
+    def __init__(self, path):
+        """ Open the trace at path for appending"""
+        self.__nextId = 0
+        if os.path.exists(path) and os.path.getsize(path) > 0:
+            for (when, conn, frame) in readTrace(path):
+                self.__nextId = max(self.__nextId, conn + 1)
+        self.__file = open(path, 'ab', BUFFER_SIZE)
+        if self.__file.tell() == 0:
+            self.__file.write(MAGIC)
+        self.__ids = {}
+        self.__pruneAt = PRUNE_MIN
+
+    def __connId(self, socket):
+        """ Get the connection id of a socket buffer"""
+        conn = self.__ids.get(socket)
+        if conn == None:
+            if len(self.__ids) >= self.__pruneAt:
+                self.__prune()
+            conn = self.__nextId
+            self.__nextId += 1
+            self.__ids[socket] = conn
+        return conn
+
+    def __prune(self):
+        """ Record and forget connections the handler closed itself"""
+        for s in [s for s in self.__ids if s.isClosed()]:
+            self.recordClose(s)
+        self.__pruneAt = max(PRUNE_MIN, 2 * len(self.__ids))
+
+    def recordFrame(self, socket, frame):
+        """ Record a frame received on a socket buffer"""
+        frame = frame[:0xffff]
+        self.__file.write(
+            RECORD.pack(time.time(), self.__connId(socket), len(frame))
+        )
+        self.__file.write(frame)
+
+    def recordClose(self, socket):
+        """ Record a connection closing"""
+        conn = self.__ids.pop(socket, None)
+        if conn != None:
+            self.__file.write(RECORD.pack(time.time(), conn, 0))
+
+    def close(self):
+        """ Flush and close the trace"""
+        self.__file.close()
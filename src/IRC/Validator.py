@@ -0,0 +1,189 @@
+"""
+IRC.Validator
+
+Compiles the JSON schemas in IRC.Schema into plain Python checks.
+jsonschema re-reads the schema on every validation and takes a long
+time to import, while every message sent or received is validated,
+so the compiled validator is built once and cached instead.
+
+Only the draft 4 keywords used by IRC.Schema are supported, compiling
+a schema using any other validation keyword raises a ValueError.
+"""
+import re
+import IRC.Schema
+
+#Keywords that the compiled checks don't implement
+UNSUPPORTED = frozenset([
+    'additionalItems', 'allOf', 'anyOf', 'dependencies', 'exclusiveMaximum',
+    'exclusiveMinimum', 'format', 'maxItems', 'maxLength', 'maxProperties',
+    'maximum', 'minLength', 'minProperties', 'multipleOf', 'not'
+])
+
+TYPES = {
+    'array': lambda i: isinstance(i, list),
+    'boolean': lambda i: isinstance(i, bool),
+    'integer': lambda i: isinstance(i, (int, long)) and
+    not isinstance(i, bool),
+    'null': lambda i: i is None,
+    'number': lambda i: isinstance(i, (int, long, float)) and
+    not isinstance(i, bool),
+    'object': lambda i: isinstance(i, dict),
+    'string': lambda i: isinstance(i, basestring),
+}
+
+#Compiled validator of IRC.Schema.DEFN
+compiled = None
+
+
+def isValid(msg):
+    """ Does the message follow the IRC schema?"""
+    global compiled
+    if compiled == None:
+        compiled = compileSchema(IRC.Schema.DEFN)
+    return compiled(msg)
+
+
+def unique(items):
+    """ Are all items of a list different?"""
+    try:
+        return len(set(items)) == len(items)
+    except TypeError:
+        return all(
+            items[i] != items[j]
+            for i in xrange(len(items)) for j in xrange(i)
+        )
+
+
+def compileSchema(schema):
+    """ Compile a schema into a function returning if an instance is valid"""
+    return Compiler(schema).compile(schema)
+
+
+class Compiler(object):
+    """ Compiles the parts of a schema, sharing the checks of $refs"""
+
+    def __init__(self, root):
+        """ Initialize a compiler for the schema root"""
+        self.__root = root
+        self.__refs = {}
+
+    def __ref(self, ref):
+        """ Check the schema a local JSON pointer refers to
+
+        The target is compiled on first use so recursive references work.
+        """
+        if not ref.startswith('#'):
+            raise ValueError("Only local $ref supported: {r}".format(r=ref))
+        if ref not in self.__refs:
+            self.__refs[ref] = None
+            target = self.__root
+            for part in ref[1:].split('/')[1:]:
+                target = target[part.replace('~1', '/').replace('~0', '~')]
+            self.__refs[ref] = self.compile(target)
+        return lambda i: self.__refs[ref](i)
+
+    def compile(self, schema):
+        """ Compile one schema object into a check"""
+        if '$ref' in schema:
+            return self.__ref(schema['$ref'])
+        for keyword in schema:
+            if keyword in UNSUPPORTED:
+                raise ValueError(
+                    "Unsupported schema keyword: {k}".format(k=keyword)
+                )
+
+        checks = []
+        if 'type' in schema:
+            types = schema['type']
+            if isinstance(types, basestring):
+                checks.append(TYPES[types])
+            else:
+                matches = [TYPES[t] for t in types]
+                checks.append(lambda i: any(m(i) for m in matches))
+        if 'enum' in schema:
+            enum = schema['enum']
+            checks.append(lambda i: i in enum)
+        if 'pattern' in schema:
+            pattern = re.compile(schema['pattern'])
+            checks.append(
+                lambda i: not isinstance(i, basestring) or
+                pattern.search(i) != None
+            )
+        if 'minimum' in schema:
+            minimum = schema['minimum']
+            number = TYPES['number']
+            checks.append(lambda i: not number(i) or i >= minimum)
+        checks.extend(self.__arrayChecks(schema))
+        checks.extend(self.__objectChecks(schema))
+        if 'oneOf' in schema:
+            options = [self.compile(s) for s in schema['oneOf']]
+            checks.append(lambda i: sum(1 for o in options if o(i)) == 1)
+
+        if len(checks) == 1:
+            return checks[0]
+        return lambda i: all(c(i) for c in checks)
+
+    def __arrayChecks(self, schema):
+        """ Checks of the keywords that apply to arrays"""
+        checks = []
+        if 'minItems' in schema:
+            minItems = schema['minItems']
+            checks.append(
+                lambda i: not isinstance(i, list) or len(i) >= minItems
+            )
+        if schema.get('uniqueItems', False):
+            checks.append(lambda i: not isinstance(i, list) or unique(i))
+        if 'items' in schema:
+            if not isinstance(schema['items'], dict):
+                raise ValueError("Only a single items schema is supported")
+            item = self.compile(schema['items'])
+            checks.append(
+                lambda i: not isinstance(i, list) or all(item(x) for x in i)
+            )
+        return checks
+
+    def __objectChecks(self, schema):
+        """ Checks of the keywords that apply to objects"""
+        checks = []
+        if 'required' in schema:
+            required = schema['required']
+            checks.append(
+                lambda i: not isinstance(i, dict) or
+                all(r in i for r in required)
+            )
+        properties = dict(
+            (k, self.compile(s))
+            for (k, s) in schema.get('properties', {}).items()
+        )
+        patterns = [
+            (re.compile(p), self.compile(s))
+            for (p, s) in schema.get('patternProperties', {}).items()
+        ]
+        additional = schema.get('additionalProperties', True)
+        if isinstance(additional, dict):
+            additional = self.compile(additional)
+
+        if len(properties) == 0 and len(patterns) == 0 and additional is True:
+            return checks
+
+        def check(i):
+            if not isinstance(i, dict):
+                return True
+            for (k, v) in i.iteritems():
+                matched = False
+                if k in properties:
+                    matched = True
+                    if not properties[k](v):
+                        return False
+                for (p, s) in patterns:
+                    if p.search(k) != None:
+                        matched = True
+                        if not s(v):
+                            return False
+                if not matched and additional is not True:
+                    if additional is False or not additional(v):
+                        return False
+            return True
+
+        checks.append(check)
+        return checks
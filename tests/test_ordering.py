@@ -0,0 +1,191 @@
+"""
+Tests of the order a client receives the server's messages in.
+
+Socket buffers are checked on their own, then a server and headless
+clients run in process on one loop, linked by loopback connections.
+"""
+import imp
+import logging
+import os
+import unittest
+
+from IRC.Client import HeadlessClient
+from IRC.Handler import SocketBuffer, PRIORITY_REPLY, PRIORITY_BULK
+from IRC.Host import SessionHost
+
+SERVER = os.path.join(os.path.dirname(__file__), '..', 'src', 'irc_server')
+irc_server = imp.load_source('irc_server', SERVER)
+
+#Seconds a test may run before it is failed
+TIMEOUT = 5
+#Events the clients record
+EVENTS = ('nick', 'quit', 'join', 'leave', 'channels', 'error')
+
+
+class Sink(object):
+    """ A socket taking everything sent to it"""
+
+    def __init__(self):
+        self.sent = ''
+
+    def send(self, data):
+        self.sent += data
+        return len(data)
+
+
+class FenceTest(unittest.TestCase):
+    """ Replies go ahead of bulk, unless the buffer is fenced"""
+
+    def setUp(self):
+        self.sink = Sink()
+        self.sb = SocketBuffer(self.sink)
+
+    def test_reply_overtakes_bulk(self):
+        self.sb.addMessage('bulk\n', PRIORITY_BULK)
+        self.sb.addMessage('reply\n', PRIORITY_REPLY)
+        self.sb.send()
+        self.assertEqual(self.sink.sent, 'reply\nbulk\n')
+
+    def test_fenced_reply_waits(self):
+        self.sb.addMessage('bulk\n', PRIORITY_BULK)
+        self.sb.fence()
+        self.sb.addMessage('later\n', PRIORITY_BULK)
+        self.sb.addMessage('reply\n', PRIORITY_REPLY)
+        self.sb.send()
+        self.assertEqual(self.sink.sent, 'bulk\nlater\nreply\n')
+
+    def test_fence_lifted_once_sent(self):
+        self.sb.addMessage('bulk\n', PRIORITY_BULK)
+        self.sb.fence()
+        self.sb.send()
+        self.sb.addMessage('later\n', PRIORITY_BULK)
+        self.sb.addMessage('reply\n', PRIORITY_REPLY)
+        self.sb.send()
+        self.assertEqual(self.sink.sent, 'bulk\nreply\nlater\n')
+
+
+class OrderingTest(unittest.TestCase):
+    """ A server with clients on one loop"""
+
+    def setUp(self):
+        logging.disable(logging.CRITICAL)
+        self.host = SessionHost()
+        self.server = irc_server.IRCServer('localhost', 0)
+        self.server.setFloodControl((0, 0), (0, 0), (0, 0))
+        self.host.addSession(self.server)
+
+    def tearDown(self):
+        logging.disable(logging.NOTSET)
+
+    def client(self, named):
+        """ Connect a headless client recording the events it receives
+
+        named is called with the client once the server named it.
+        """
+        client = HeadlessClient('', 0)
+        client.setLoopback(self.server)
+        client.connect()
+        client.events = []
+        for event in EVENTS:
+            client.on(event, self.__recorder(client, event))
+        client.on(
+            'nick', lambda src, nick: src == 'NEWUSER' and named(client)
+        )
+        self.host.addSession(client)
+        return client
+
+    def __recorder(self, client, event):
+        """ Append the event and its arguments to client.events"""
+        return lambda *args: client.events.append((event,) + args)
+
+    def runUntil(self, done):
+        """ Run the loop until done() is true or the timeout passes"""
+        def check():
+            if done():
+                self.host.stop()
+            else:
+                self.host.callLater(0.01, check)
+        self.host.callLater(0.01, check)
+        self.host.callLater(TIMEOUT, self.host.stop)
+        self.host.run()
+        self.assertTrue(done(), "Timed out")
+
+    def test_nick_then_quit(self):
+        """ A quit does not overtake the nick change before it"""
+        def named(client):
+            client.inputCmd('/nick renamed1')
+            client.inputCmd('/quit')
+        client = self.client(named)
+        self.runUntil(lambda: not client.isRunning())
+
+        events = [e for e in client.events if e[0] in ('nick', 'quit')]
+        self.assertEqual(events[1][:3], ('nick', events[0][2], 'renamed1'))
+        self.assertEqual(events[2][:2], ('quit', 'renamed1'))
+
+    def test_nick_then_quit_broadcast(self):
+        """ A quit does not overtake a nick change queued to a channel"""
+        self.server.setFanoutSlice(1)
+        ready = []
+
+        def joined(client, src, channels):
+            if src == client.getNick() and ready.count(client) == 0:
+                ready.append(client)
+                if len(ready) == 1:
+                    second.inputCmd('/join #x')
+                else:
+                    second.inputCmd('/nick renamed1')
+                    second.inputCmd('/quit')
+        first = self.client(lambda c: c.inputCmd('/join #x'))
+        second = self.client(lambda c: None)
+        for c in (first, second):
+            c.on('join', lambda src, channels, c=c: joined(c, src, channels))
+        self.runUntil(lambda: not second.isRunning())
+
+        events = [e for e in second.events if e[0] in ('nick', 'quit')]
+        self.assertEqual(events[-2][2:], ('renamed1',))
+        self.assertEqual(events[-1][:2], ('quit', 'renamed1'))
+
+    def test_join_then_channels(self):
+        """ A reply does not overtake the join before it"""
+        def named(client):
+            client.inputCmd('/join #x')
+            client.inputCmd('/channels')
+        client = self.client(named)
+        self.runUntil(lambda: any(e[0] == 'channels' for e in client.events))
+
+        events = [e[0] for e in client.events if e[0] in ('join', 'channels')]
+        self.assertEqual(events, ['join', 'channels'])
+
+    def test_join_then_channels_broadcast(self):
+        """ A reply does not overtake a join queued to a channel"""
+        self.server.setFanoutSlice(1)
+
+        def joined(src, channels):
+            if src == first.getNick():
+                second.inputCmd('/join #x')
+                second.inputCmd('/channels')
+        first = self.client(lambda c: c.inputCmd('/join #x'))
+        second = self.client(lambda c: None)
+        first.on('join', joined)
+        self.runUntil(lambda: any(e[0] == 'channels' for e in second.events))
+
+        events = [e[0] for e in second.events if e[0] in ('join', 'channels')]
+        self.assertEqual(events, ['join', 'channels'])
+
+    def test_quit_not_resumed(self):
+        """ A client that asked to quit stops when the server closes"""
+        resumes = []
+        self.server.receivedResume = lambda *args: resumes.append(args)
+
+        def named(client):
+            #As if the quit echoed to it went unrecognised
+            client.receivedQuit = lambda *args: None
+            client.inputCmd('/quit')
+        client = self.client(named)
+        client.setReconnect(TIMEOUT)
+        self.runUntil(lambda: not client.isRunning())
+        self.assertEqual(resumes, [])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,99 @@
+"""
+Differential tests of IRC.Validator against jsonschema.
+
+The compiled validator must accept exactly the messages jsonschema
+accepts for IRC.Schema.DEFN. Messages built by IRC.Message are
+mutated field by field into a corpus of valid and invalid messages.
+"""
+import unittest
+
+import jsonschema
+
+import IRC.Message
+import IRC.Schema
+import IRC.Validator
+
+TOKEN = '0123456789abcdef0123456789abcdef'
+
+#Values each field of a message is replaced by
+ODD_VALUES = [
+    None, True, 0, -1, 7, 1.5, '', 'x', 'x' * 40, '!!', '#', '#chan',
+    '#' + 'c' * 20, TOKEN, TOKEN.upper(), [], ['#a'], ['#a', '#a'], ['bob'],
+    [1], [None], {}, {'#a': 1}, {'#a': -1}, {'#a': 'x'}, {'bob': 1}
+]
+
+
+def builtMessages():
+    """ A message of every kind, built as the client and server do"""
+    m = IRC.Message.IRCMessage('bob')
+    return [
+        m.cmdNick('alice'), m.cmdQuit('bye'), m.cmdSQuit('bye'),
+        m.cmdJoin(['#a', '#b']), m.cmdJoin(['#a'], 3, {'#a': 2}),
+        m.cmdLeave(['#a'], 'bye'), m.cmdChannels(), m.cmdChannels(4),
+        m.cmdUsers(['#a'], True), m.cmdUsers(['#a'], False, 5, {'#a': 1}),
+        m.cmdMsg('hello', ['#a', 'alice']), m.cmdPing('1'), m.cmdPong('1'),
+        m.cmdSession(TOKEN), m.cmdResume(TOKEN),
+        m.errorMsg('flood', 'Too fast'), m.errorMsg('schema', 'Bad', 6),
+        m.replyChannels(['#a', '#b']), m.replyChannels([], 7),
+        m.replyNames('#a', ['bob', 'alice'], True),
+        m.replyNames('#a', [], False, 8, 3),
+        m.replyDelta('#a', 4, ['bob'], ['alice'], True, 9),
+    ]
+
+
+def mutations(msg):
+    """ The message with each field removed, replaced or added to"""
+    yield msg
+    for key in msg:
+        changed = dict(msg)
+        del changed[key]
+        yield changed
+        for value in ODD_VALUES:
+            changed = dict(msg)
+            changed[key] = value
+            yield changed
+        if isinstance(msg[key], list):
+            for value in ODD_VALUES:
+                changed = dict(msg)
+                changed[key] = msg[key] + [value]
+                yield changed
+    for value in ODD_VALUES:
+        changed = dict(msg)
+        changed['extra'] = value
+        yield changed
+
+
+class TestValidator(unittest.TestCase):
+    """ The compiled validator agrees with jsonschema"""
+
+    def setUp(self):
+        self.reference = jsonschema.Draft4Validator(IRC.Schema.DEFN)
+
+    def assertAgrees(self, msg):
+        self.assertEqual(
+            IRC.Validator.isValid(msg), self.reference.is_valid(msg),
+            "Validators disagree on {m!r}".format(m=msg)
+        )
+
+    def test_built_messages_valid(self):
+        for msg in builtMessages():
+            self.assertTrue(IRC.Validator.isValid(msg), msg)
+
+    def test_mutated_messages(self):
+        for msg in builtMessages():
+            for changed in mutations(msg):
+                self.assertAgrees(changed)
+
+    def test_not_objects(self):
+        for value in ODD_VALUES + [{'cmd': 'bogus'}, {'reply': 'bogus'}]:
+            self.assertAgrees(value)
+
+    def test_unsupported_keyword(self):
+        self.assertRaises(
+            ValueError, IRC.Validator.compileSchema,
+            {'type': 'string', 'maxLength': 3}
+        )
+
+
+if __name__ == '__main__':
+    unittest.main()